@@ -6,7 +6,11 @@ flac_autofix.py — 递归扫描并修复异常 FLAC（Windows 跨盘安全版
 更新要点：
 - **Windows 跨盘安全**：所有临时文件在目标文件**同一目录**创建，避免 WinError 17。
 - **atomic_replace 更健壮**：若目标被占用会尝试 .old 回退路径。
-- 无损重封装（ffmpeg 优先），可选 flac 官方工具，支持保留封面（需 metaflac，且可限大小）。
+- 无损重封装（ffmpeg 优先），可选 flac 官方工具，支持保留封面（原样搬运 PICTURE 块，可限大小）。
+- 仅结构性问题且可正常解码时，纯 Python **无损 remux**：重写元数据头并逐字节复制音频帧，不重新编码。
+- 识别开头被塞入的 ID3v2 标签；只有这一个问题时整段拷贝去掉前缀（strip），不动元数据与音频。
+- 只读文件末尾几十 KB：识别尾部标签/垃圾数据（ftruncate 去掉）与拷贝中断导致的流截断（--fix-length 按实际长度改写 STREAMINFO）。
+- 核对 SEEKTABLE（逐点抽查帧头），无效时在 patch/remux/重编码中按 --seek-interval 重建。
 - 并发/CSV/备份/干跑。
 
 依赖：pip install soundfile；工具建议安装 ffmpeg（强烈推荐），可选 flac/metaflac。
@@ -14,15 +18,23 @@ flac_autofix.py — 递归扫描并修复异常 FLAC（Windows 跨盘安全版
 from __future__ import annotations
 import argparse
 import csv
+import hashlib
 import os
 import sys
 import shutil
+import json
+import math
+import sqlite3
 import subprocess
 import tempfile
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from dataclasses import dataclass
+import queue
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field, replace
 from pathlib import Path
-from typing import List, Optional, Tuple, Dict, Any
+from typing import List, Optional, Tuple, Dict, Any, Iterable, Iterator, Callable
 
 # ---------------------------- 基础工具 ----------------------------
 
@@ -37,6 +49,82 @@ def human_bytes(n: int) -> str:
         v /= 1024
     return f"{v}B"
 
+def copy_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    """把 src 的 [offset, offset+count) 追加到 dst 当前位置；优先内核态拷贝（copy_file_range/sendfile）。"""
+    done = 0
+    for fn in ('copy_file_range', 'sendfile'):
+        impl = getattr(os, fn, None)
+        if impl is None:
+            continue
+        try:
+            while done < count:
+                if fn == 'copy_file_range':
+                    n = impl(src_fd, dst_fd, count - done, offset + done)
+                else:
+                    n = impl(dst_fd, src_fd, offset + done, count - done)
+                if n == 0:
+                    break
+                done += n
+            return done
+        except OSError:
+            # 跨文件系统/不支持的平台：回退到下一种方式，从已完成处继续
+            continue
+    while done < count:
+        os.lseek(src_fd, offset + done, os.SEEK_SET)
+        buf = os.read(src_fd, min(1 << 20, count - done))
+        if not buf:
+            break
+        os.write(dst_fd, buf)
+        done += len(buf)
+    return done
+
+_ROTATIONAL: Dict[int, Optional[bool]] = {}
+
+def is_rotational(dev: int) -> Optional[bool]:
+    """st_dev 所在块设备是否为机械盘（Linux sysfs）；网络盘/其它平台返回 None。"""
+    if dev in _ROTATIONAL:
+        return _ROTATIONAL[dev]
+    rot: Optional[bool] = None
+    try:
+        base = os.path.realpath(f'/sys/dev/block/{os.major(dev)}:{os.minor(dev)}')
+        # 分区本身没有 queue/，取其所属整盘
+        for d in (base, os.path.dirname(base)):
+            q = os.path.join(d, 'queue', 'rotational')
+            if os.path.exists(q):
+                with open(q) as f:
+                    rot = f.read().strip() == '1'
+                break
+    except (OSError, AttributeError, ValueError):
+        pass
+    _ROTATIONAL[dev] = rot
+    return rot
+
+FS_IOC_FIEMAP = 0xC020660B
+
+def fiemap_offset(path: Path) -> Optional[int]:
+    """文件首个 extent 的物理偏移（Linux FIEMAP）；不支持时返回 None。"""
+    try:
+        import fcntl, struct
+        # struct fiemap 头 32 字节 + 1 个 struct fiemap_extent（56 字节）
+        buf = bytearray(struct.pack('=QQIIII', 0, 0xFFFFFFFFFFFFFFFF, 0, 0, 1, 0) + bytes(56))
+        with open(path, 'rb') as f:
+            fcntl.ioctl(f.fileno(), FS_IOC_FIEMAP, buf)
+        if struct.unpack_from('=I', buf, 20)[0] == 0:
+            return None
+        return struct.unpack_from('=Q', buf, 32 + 8)[0]
+    except (ImportError, OSError):
+        return None
+
+def order_by_extent(files: List[Path]) -> List[Path]:
+    """机械盘上按物理位置排序，让磁头顺序前进；其它介质保持原顺序。"""
+    try:
+        if not is_rotational(os.stat(files[0].parent).st_dev):
+            return files
+    except OSError:
+        return files
+    offs = {p: fiemap_offset(p) for p in files}
+    return sorted(files, key=lambda p: (offs[p] is None, offs[p] or 0))
+
 # ---------------------------- FLAC 解析 ----------------------------
 
 @dataclass
@@ -54,6 +142,11 @@ class StreamInfo:
     channels: int
     bits_per_sample: int
     total_samples: int
+    md5: bytes = b''  # 未编码音频的 MD5 签名；全 0 表示编码器未设置
+    min_blocksize: int = 0
+    max_blocksize: int = 0
+    min_framesize: int = 0
+    max_framesize: int = 0
 
 @dataclass
 class FlacProbe:
@@ -66,8 +159,101 @@ class FlacProbe:
     picture_bytes_total: int
     unknown_block_count: int
     last_block_marked: bool
+    audio_offset: int = 0  # 首个音频帧的绝对偏移；0 表示未能定位到帧同步码
+    io_calls: int = 0      # 解析时发出的读/定位调用数
+    file_size: int = 0
+    stream_offset: int = 0  # 'fLaC' 的偏移；>0 表示前面被塞了 ID3v2 标签（所有块偏移仍为文件绝对偏移）
+
+def id3v2_size(hdr: bytes) -> int:
+    """ID3v2 标签总长（10 字节头 + synchsafe 长度 + 可选 footer）；不是 ID3v2 头返回 0。"""
+    if len(hdr) < 10 or hdr[:3] != b'ID3' or hdr[3] == 0xFF or hdr[4] == 0xFF or any(b & 0x80 for b in hdr[6:10]):
+        return 0
+    size = (hdr[6] << 21) | (hdr[7] << 14) | (hdr[8] << 7) | hdr[9]
+    return 10 + size + (10 if hdr[5] & 0x10 else 0)
+
+def is_frame_sync(b: bytes) -> bool:
+    return len(b) >= 2 and b[0] == 0xFF and (b[1] & 0xFE) == 0xF8
+
+HEADER_WINDOW = 32 * 1024        # 首次 pread 的窗口：无封面文件的整个元数据区
+HEADER_WINDOW_MAX = 1024 * 1024  # 块链越出窗口时窗口翻倍，直到这个上限
+
+def pread_at(fd: int) -> Callable[[int, int], bytes]:
+    """返回按绝对偏移读取 fd 的 read_at(offset, n)；Windows 没有 pread 时退回 lseek + read。"""
+    if hasattr(os, 'pread'):
+        return lambda offset, n: os.pread(fd, n, offset)
+    def read_at(offset: int, n: int) -> bytes:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, n)
+    return read_at
+
+PREAD_IO_CALLS = 1 if hasattr(os, 'pread') else 2  # pread_at 每次读取发出的系统调用数
+
+class _HeaderReader:
+    """按绝对偏移读取文件头部；io_calls 统计实际发出的读/定位调用数。"""
+    def __init__(self, f):
+        self.f = f
+        self.io_calls = 0
+
+    def read_at(self, offset: int, n: int) -> bytes:
+        raise NotImplementedError
 
-def parse_flac(path: Path) -> FlacProbe:
+    def close(self):
+        pass
+
+class _StreamReader(_HeaderReader):
+    """旧实现：每个块一次 seek + read。"""
+    def read_at(self, offset: int, n: int) -> bytes:
+        self.f.seek(offset)
+        self.io_calls += 2
+        return self.f.read(n)
+
+class _PreadReader(_HeaderReader):
+    """pread 读入一个窗口，后续块头直接在内存里切片；越出窗口才再读一次，并把窗口翻倍（大封面等长块链）。"""
+    def __init__(self, f, window: int = HEADER_WINDOW):
+        super().__init__(f)
+        self.pread = pread_at(f.fileno())
+        self.window = window
+        self.base = 0
+        self.buf = b''
+
+    def read_at(self, offset: int, n: int) -> bytes:
+        end = offset + n
+        if offset < self.base or end > self.base + len(self.buf):
+            if self.buf:
+                self.window = min(self.window * 2, HEADER_WINDOW_MAX)
+            self.buf = self.pread(offset, max(self.window, n))
+            self.io_calls += PREAD_IO_CALLS
+            self.base = offset
+        rel = offset - self.base
+        return self.buf[rel:rel + n]
+
+class _MmapReader(_HeaderReader):
+    """整个文件 mmap 后切片读取，只剩一次 mmap 调用（缺页由内核处理）。"""
+    def __init__(self, f):
+        super().__init__(f)
+        import mmap
+        self.io_calls += 1
+        try:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件
+            self.mm = None
+
+    def read_at(self, offset: int, n: int) -> bytes:
+        if self.mm is None:
+            return b''
+        return self.mm[offset:offset + n]
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+
+PARSER_BACKENDS = {'pread': _PreadReader, 'mmap': _MmapReader, 'stream': _StreamReader}
+
+def parse_flac(path: Path, backend: str = 'pread') -> FlacProbe:
+    with path.open('rb', buffering=0) as f:
+        return _parse_open(f, backend)
+
+def _parse_open(f, backend: str) -> FlacProbe:
     blocks: List[MetaBlock] = []
     is_flac = False
     streaminfo: Optional[StreamInfo] = None
@@ -75,59 +261,718 @@ def parse_flac(path: Path) -> FlacProbe:
     picture_bytes = 0
     unknown_cnt = 0
     last_marked = False
+    audio_offset = 0
 
-    with path.open('rb') as f:
-        head = f.read(4)
+    size = os.fstat(f.fileno()).st_size
+    r = PARSER_BACKENDS[backend](f)
+    try:
+        # 跳过开头的 ID3v2 标签（个别标签软件会连续写好几个）
+        start = 0
+        while True:
+            n = id3v2_size(r.read_at(start, 10))
+            if n == 0:
+                break
+            start += n
+        head = r.read_at(start, 4)
         if head != b'fLaC':
-            return FlacProbe(False,'Not native FLAC (missing fLaC magic)',False,[],None,0,0,0,False)
+            return FlacProbe(False,'Not native FLAC (missing fLaC magic)',False,[],None,0,0,0,False,
+                             io_calls=r.io_calls, file_size=size, stream_offset=start)
         is_flac = True
+        pos = start + 4
         while True:
-            hdr = f.read(4)
+            hdr = r.read_at(pos, 4)
             if len(hdr) < 4:
                 break
             b0,b1,b2,b3 = hdr
+            if is_frame_sync(hdr):
+                # 未标记 is_last，直接撞上了音频帧
+                audio_offset = pos
+                break
             is_last = (b0 & 0x80) != 0
             btype = (b0 & 0x7F)
             length = (b1<<16)|(b2<<8)|b3
-            offset = f.tell() - 4
-            blocks.append(MetaBlock(btype,length,offset,is_last))
+            blocks.append(MetaBlock(btype,length,pos,is_last))
             total_meta += length + 4
             if btype == 6:
                 picture_bytes += length
             if btype not in TYPE_NAMES:
                 unknown_cnt += 1
             if btype == 0 and length == 34:
-                data = f.read(34)
+                data = r.read_at(pos + 4, 34)
                 a = data[10:18]
                 x = int.from_bytes(a, 'big')
                 sr = (x >> (3+5+36)) & ((1<<20)-1)
                 ch = ((x >> (5+36)) & 0b111) + 1
                 bps = ((x >> 36) & 0b11111) + 1
                 total = x & ((1<<36)-1)
-                streaminfo = StreamInfo(sr,ch,bps,total)
-            else:
-                f.seek(length,1)
+                streaminfo = StreamInfo(sr,ch,bps,total,data[18:34],
+                                        int.from_bytes(data[0:2],'big'), int.from_bytes(data[2:4],'big'),
+                                        int.from_bytes(data[4:7],'big'), int.from_bytes(data[7:10],'big'))
+            pos += 4 + length
             if is_last:
                 last_marked = True
+                if is_frame_sync(r.read_at(pos, 2)):
+                    audio_offset = pos
                 break
-    return FlacProbe(True,'OK',is_flac,blocks,streaminfo,total_meta,picture_bytes,unknown_cnt,last_marked)
+    finally:
+        r.close()
+    return FlacProbe(True,'OK',is_flac,blocks,streaminfo,total_meta,picture_bytes,unknown_cnt,last_marked,audio_offset,r.io_calls,size,start)
+
+def bench_parse(files: List[Path], repeat: int = 3) -> List[Dict[str,Any]]:
+    """对比各解析后端：每文件完整探测（头部 + 末尾 + SEEKTABLE）的平均耗时与 I/O 调用数。"""
+    rows: List[Dict[str,Any]] = []
+    for p in files:  # 预热：页缓存与 CRC 查表不算进第一个后端
+        probe_file(p)
+    for name in PARSER_BACKENDS:
+        calls = 0
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            for p in files:
+                calls += probe_file(p, name)[0].io_calls
+        n = max(1, len(files) * repeat)
+        rows.append({'backend': name, 'ms_per_file': (time.perf_counter() - t0) * 1000 / n, 'io_calls_per_file': calls / n})
+    return rows
 
 # ---------------------------- 解码验证 ----------------------------
 
-def soundfile_decode_ok(path: Path, chunk_frames: int = 65536) -> Tuple[bool,str]:
+def pcm_md5_bytes(data, bits_per_sample: int):
+    """把 libsndfile 左对齐的 int16/int32 样本还原成 FLAC MD5 所用的格式：原始位深、小端、按字节对齐、交错。
+    位深正好等于容器宽度（16 位读成 int16）且本机为小端时直接返回原数组，hashlib 按缓冲区读取，不再复制。"""
+    import numpy as np
+    x = data.reshape(-1)
+    shift = x.dtype.itemsize * 8 - bits_per_sample
+    width = (bits_per_sample + 7) // 8
+    if shift == 0 and sys.byteorder == 'little':
+        return x
+    if shift > 0:
+        x = x >> shift
+    if width == 1:
+        return x.astype('i1').tobytes()
+    if width == 2:
+        return x.astype('<i2').tobytes()
+    if width == 4:
+        return x.astype('<i4').tobytes()
+    return x.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :width].tobytes()
+
+DECODE_CHUNK_BYTES = 512 * 1024  # 每次解码读入的 PCM 字节数，约为 L2 缓存大小
+_decode_buffers = threading.local()
+
+def native_dtype(sf_file) -> str:
+    """libsndfile 只能读出 int16/int32：16 位及以下用 int16，24 位用 int32（左对齐），不做多余的位深转换。"""
+    return 'int16' if sf_file.subtype in ('PCM_S8', 'PCM_U8', 'PCM_16') else 'int32'
+
+def decode_buffer(frames: int, channels: int, dtype: str):
+    """每个线程（解码进程里即每个进程）复用一块预分配缓冲区，形状不变时不再重新分配。"""
+    import numpy as np
+    if frames <= 0:
+        frames = max(4096, DECODE_CHUNK_BYTES // (channels * np.dtype(dtype).itemsize) // 4096 * 4096)
+    buf = getattr(_decode_buffers, 'buf', None)
+    if buf is None or buf.shape != (frames, channels) or buf.dtype != np.dtype(dtype):
+        buf = _decode_buffers.buf = np.empty((frames, channels), dtype=dtype)
+    return buf
+
+def new_sample_seed() -> str:
+    """每次运行取一个新种子：反复扫描时抽检位置各不相同，逐次累积覆盖整个文件。"""
+    return str(int.from_bytes(os.urandom(4), 'big'))
+
+def soundfile_sample_ok(path: Path, windows: int = 8, window_frames: int = 65536,
+                        seed: str = 'path') -> Tuple[bool,str]:
+    """随机 seek 到 windows 个位置各解码一小段，作为快速抽检。
+    位置由 seed 与路径共同确定，同一种子可复现；seed='path' 时只由路径确定，每次运行都抽检同样的位置。"""
+    import random
     try:
         import soundfile as sf
     except Exception as e:
         return False, f"soundfile import failed: {e}"
     try:
         with sf.SoundFile(str(path), 'r') as f:
+            total = f.frames
+            buf = decode_buffer(window_frames, f.channels, native_dtype(f))
+            rng = random.Random(os.fspath(path) if seed == 'path' else f'{seed}:{os.fspath(path)}')
+            starts = sorted(rng.randrange(max(1, total - window_frames)) for _ in range(max(1, windows)))
+            for pos in starts:
+                f.seek(pos)
+                f.read(out=buf)
+        return True, f'OK (soundfile 抽检 {len(starts)} 段, seed {seed})'
+    except Exception as e:
+        return False, f"DECODE_FAIL (soundfile 抽检): {e.__class__.__name__}: {e}"
+
+def soundfile_decode_ok(path: Path, chunk_frames: int = 0, expect_md5: Optional[bytes] = None,
+                        bits_per_sample: int = 0) -> Tuple[bool,str]:
+    """完整解码一遍；给出 expect_md5 时顺带对解码出的 PCM 做 MD5 并与 STREAMINFO 比对。
+    按文件原生样本格式读入预分配缓冲区（out=），chunk_frames 为 0 时按声道数与样本宽度换算成约 DECODE_CHUNK_BYTES。"""
+    try:
+        import soundfile as sf
+    except Exception as e:
+        return False, f"soundfile import failed: {e}"
+    check_md5 = bool(expect_md5) and any(expect_md5) and bits_per_sample > 0
+    h = hashlib.md5() if check_md5 else None
+    try:
+        with sf.SoundFile(str(path), 'r') as f:
+            buf = decode_buffer(chunk_frames, f.channels, native_dtype(f))
             while True:
-                data = f.read(frames=chunk_frames, dtype='int16', always_2d=False)
+                data = f.read(out=buf)
                 if len(data) == 0:
                     break
-        return True, 'OK (soundfile)'
+                if h is not None:
+                    h.update(pcm_md5_bytes(data, bits_per_sample))
     except Exception as e:
         return False, f"DECODE_FAIL (soundfile): {e.__class__.__name__}: {e}"
+    if h is None:
+        if expect_md5 is not None and not any(expect_md5):
+            return True, 'OK (soundfile, STREAMINFO 未设置 MD5)'
+        return True, 'OK (soundfile)'
+    if h.digest() != expect_md5:
+        return False, f"MD5_MISMATCH: 解码 {h.hexdigest()} != STREAMINFO {expect_md5.hex()}"
+    return True, 'OK (soundfile, MD5 一致)'
+
+# ---------------------------- 帧级校验 ----------------------------
+
+def _crc_table(poly: int, width: int) -> List[int]:
+    top, mask = 1 << (width - 1), (1 << width) - 1
+    table = []
+    for i in range(256):
+        c = i << (width - 8)
+        for _ in range(8):
+            c = ((c << 1) ^ poly) if c & top else (c << 1)
+        table.append(c & mask)
+    return table
+
+CRC8_TABLE = _crc_table(0x07, 8)
+CRC16_TABLE = _crc_table(0x8005, 16)
+
+def crc8(data: bytes) -> int:
+    c = 0
+    for b in data:
+        c = CRC8_TABLE[c ^ b]
+    return c
+
+def crc16(data: bytes, c: int = 0) -> int:
+    for b in data:
+        c = ((c << 8) & 0xFFFF) ^ CRC16_TABLE[(c >> 8) ^ b]
+    return c
+
+_BLOCKSIZE_CODES = {1: 192, 2: 576, 3: 1152, 4: 2304, 5: 4608}
+_SAMPLE_RATE_CODES = {1: 88200, 2: 176400, 3: 192000, 4: 8000, 5: 16000, 6: 22050, 7: 24000,
+                      8: 32000, 9: 44100, 10: 48000, 11: 96000}
+_SAMPLE_SIZE_CODES = {1: 8, 2: 12, 4: 16, 5: 20, 6: 24, 7: 32}
+
+@dataclass
+class FrameHeader:
+    offset: int
+    header_len: int
+    variable: bool      # 可变块长：number 为样本号；固定块长：number 为帧号
+    number: int
+    blocksize: int
+
+    def first_sample(self, si: StreamInfo) -> int:
+        return self.number if self.variable else self.number * (si.max_blocksize or self.blocksize)
+
+def parse_frame_header(buf, pos: int, si: StreamInfo) -> Optional[FrameHeader]:
+    """在 buf[pos] 处解析帧头并校验 CRC-8 及与 STREAMINFO 的一致性；不是合法帧头返回 None。"""
+    end = len(buf)
+    if pos + 6 > end or buf[pos] != 0xFF or (buf[pos+1] & 0xFE) != 0xF8:
+        return None
+    variable = bool(buf[pos+1] & 1)
+    bs_code, sr_code = buf[pos+2] >> 4, buf[pos+2] & 0x0F
+    ch_code, ss_code = buf[pos+3] >> 4, (buf[pos+3] >> 1) & 0x07
+    if bs_code == 0 or sr_code == 15 or ch_code > 10 or ss_code == 3 or buf[pos+3] & 1:
+        return None
+    if (ch_code + 1 if ch_code < 8 else 2) != si.channels:
+        return None
+    if ss_code and _SAMPLE_SIZE_CODES[ss_code] != si.bits_per_sample:
+        return None
+    if sr_code in _SAMPLE_RATE_CODES and _SAMPLE_RATE_CODES[sr_code] != si.sample_rate:
+        return None
+    # UTF-8 风格编码的帧号/样本号
+    p = pos + 4
+    b = buf[p]
+    if b < 0x80:
+        n, num = 0, b
+    elif 0xC0 <= b <= 0xFE:
+        n = 1
+        while b & (0x40 >> n):
+            n += 1
+        num = b & (0x3F >> n)
+    else:
+        return None
+    if n > (6 if variable else 5) or p + 1 + n + 1 > end:
+        return None
+    for i in range(1, n + 1):
+        c = buf[p + i]
+        if c & 0xC0 != 0x80:
+            return None
+        num = (num << 6) | (c & 0x3F)
+    p += 1 + n
+    if bs_code == 6:
+        if p + 1 > end:
+            return None
+        blocksize = buf[p] + 1; p += 1
+    elif bs_code == 7:
+        if p + 2 > end:
+            return None
+        blocksize = ((buf[p] << 8) | buf[p+1]) + 1; p += 2
+    elif bs_code >= 8:
+        blocksize = 256 << (bs_code - 8)
+    else:
+        blocksize = _BLOCKSIZE_CODES[bs_code]
+    if sr_code in (12, 13, 14):
+        p += 1 if sr_code == 12 else 2
+    if p + 1 > end or crc8(bytes(buf[pos:p])) != buf[p]:
+        return None
+    if si.max_blocksize and blocksize > si.max_blocksize:
+        return None
+    return FrameHeader(pos, p + 1 - pos, variable, num, blocksize)
+
+def find_sync_candidates(arr, start: int, end: int, chunk: int = 16 << 20):
+    """向量化查找 [start, end) 内所有 0xFFF8/0xFFF9 同步码位置；分块处理以限制临时内存。"""
+    import numpy as np
+    out = []
+    for s in range(start, end - 1, chunk):
+        e = min(end, s + chunk + 1)
+        a = arr[s:e]
+        hits = np.flatnonzero(a[:-1] == 0xFF)
+        hits = hits[(a[hits + 1] & 0xFE) == 0xF8]
+        out.append(hits + s)
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+def walk_frames(buf, candidates, si: StreamInfo) -> List[FrameHeader]:
+    """从同步码候选中挑出连续的帧链：帧号/样本号必须衔接，偶发的伪同步码自然被剔除。
+    序号断档时，只接受其后紧跟着连续帧的候选作为重新同步点。"""
+    frames: List[FrameHeader] = []
+    expect: Optional[int] = None
+    pending: Optional[FrameHeader] = None
+    for off in candidates:
+        h = parse_frame_header(buf, int(off), si)
+        if h is None:
+            continue
+        nxt = h.first_sample(si)
+        if expect is None or nxt == expect:
+            frames.append(h); pending = None
+            expect = nxt + h.blocksize
+        elif pending is not None and nxt == pending.first_sample(si) + pending.blocksize and nxt > (expect or 0):
+            frames.append(pending); frames.append(h); pending = None
+            expect = nxt + h.blocksize
+        elif nxt > expect:
+            pending = h
+    return frames
+
+_SHIFT_TABLES: Dict[int, Any] = {}
+
+def _crc16_shift(nbytes: int):
+    """返回“CRC 寄存器再吃进 nbytes 个 0 字节”的 65536 项查找表（仅支持 2 的幂）。"""
+    import numpy as np
+    if not _SHIFT_TABLES:
+        s = np.arange(65536, dtype=np.uint32)
+        t = np.array(CRC16_TABLE, dtype=np.uint16)
+        _SHIFT_TABLES[1] = (((s << 8) & 0xFFFF) ^ t[s >> 8]).astype(np.uint16)
+    n = 1
+    while n < nbytes:
+        if 2 * n not in _SHIFT_TABLES:
+            prev = _SHIFT_TABLES[n]
+            _SHIFT_TABLES[2 * n] = prev[prev]
+        n *= 2
+    return _SHIFT_TABLES[nbytes]
+
+CRC_BLOCK_CHUNKS = 1 << 13  # 每批 8K 个 8 字节块（64 KB）：查表的临时数组留在缓存里
+
+_WORD_TABLES: List[Any] = []
+
+def _crc16_word_tables():
+    """4 张 65536 项表：第 i 张为“某个 16 位字后面再跟 6-2i 个 0 字节”的 CRC，以小端视图取字，查表时顺带交换字节。"""
+    import numpy as np
+    if not _WORD_TABLES:
+        sw = np.arange(65536, dtype=np.uint32)
+        word = _crc16_shift(2)[((sw & 0xFF) << 8) | (sw >> 8)]
+        _WORD_TABLES.extend([_crc16_shift(4)[_crc16_shift(2)[word]], _crc16_shift(4)[word], _crc16_shift(2)[word], word])
+    return _WORD_TABLES
+
+def _crc16_chunks(a):
+    """a 长度为 8 的倍数：返回每个 8 字节块各自的 CRC-16（每块 4 次查表、无需逐字节），分批处理以限制临时内存。"""
+    import numpy as np
+    tables = _crc16_word_tables()
+    w = a.view('<u2').reshape(-1, 4)
+    out = np.empty(len(w), dtype=np.uint16)
+    tmp = np.empty(min(len(w), CRC_BLOCK_CHUNKS), dtype=np.uint16)
+    for s in range(0, len(w), CRC_BLOCK_CHUNKS):
+        blk, o = w[s:s + CRC_BLOCK_CHUNKS], out[s:s + CRC_BLOCK_CHUNKS]
+        t = tmp[:len(blk)]
+        np.take(tables[0], blk[:, 0], out=o)
+        for i in range(1, 4):
+            np.take(tables[i], blk[:, i], out=t)
+            o ^= t
+    return out
+
+def crc16_shift_by(c, nbytes):
+    """向量化的 crc16_advance：c 中每个 CRC 寄存器各自再吃进 nbytes[i] 个 0 字节。"""
+    import numpy as np
+    c = np.array(c, dtype=np.uint16)
+    d = np.array(nbytes, dtype=np.int64)
+    k = 0
+    while d.any():
+        m = (d & 1).astype(bool)
+        if m.any():
+            c[m] = _crc16_shift(1 << k)[c[m]]
+        d >>= 1
+        k += 1
+    return c
+
+class Crc16Prefix:
+    """a[0:p] 的 CRC-16（初值 0），记作 P(p)。区间 CRC 由前缀得到：crc(a[s:e]) = P(e) ^ shift(P(s), e - s)。
+    构造时算出每个 8 字节块的 CRC 并两两合并成一棵二叉树；之后每个位置沿树取 log2(n) 个节点拼出整块前缀，
+    再逐字节补上块内余下的不足 8 字节。"""
+    def __init__(self, a):
+        self.a = a
+        n8 = len(a) // 8
+        self.levels = [_crc16_chunks(a[:n8 * 8])]
+        while len(self.levels[-1]) > 1:
+            x = self.levels[-1]
+            m = len(x) // 2
+            self.levels.append(_crc16_shift(8 << (len(self.levels) - 1))[x[0:2 * m:2]] ^ x[1:2 * m:2])
+
+    def _chunks(self, chunks):
+        """前 chunks[i] 个整块的 CRC。"""
+        import numpy as np
+        r = np.zeros(len(chunks), dtype=np.uint16)
+        taken = np.zeros(len(chunks), dtype=np.int64)
+        for k in range(len(self.levels) - 1, -1, -1):
+            m = ((chunks >> k) & 1).astype(bool)
+            if m.any():
+                r[m] = _crc16_shift(8 << k)[r[m]] ^ self.levels[k][taken[m] >> k]
+                taken[m] += 1 << k
+        return r
+
+    def at(self, positions):
+        """对 positions 中每个 p 求 P(p)。"""
+        import numpy as np
+        pos = np.asarray(positions, dtype=np.int64)
+        chunks, inv = np.unique(pos // 8, return_inverse=True)
+        r = self._chunks(chunks)[inv.reshape(-1)]
+        table = np.array(CRC16_TABLE, dtype=np.uint16)
+        base, rem = pos - pos % 8, pos % 8
+        for i in range(7):
+            m = rem > i
+            if not m.any():
+                break
+            c = r[m]
+            r[m] = (c << 8) ^ table[(c >> 8) ^ self.a[base[m] + i]]
+        return r
+
+    def run(self, lo: int, hi: int):
+        """P(lo), P(lo+1), ..., P(hi)：逐个整块起点求值后按列推进 8 步，不用逐位置掩码。"""
+        import numpy as np
+        b0, b1 = lo // 8, hi // 8 + 1
+        blk = np.zeros((b1 - b0) * 8, dtype=np.uint8)
+        src = self.a[b0 * 8:b1 * 8]
+        blk[:len(src)] = src
+        blk = blk.reshape(-1, 8)
+        table = np.array(CRC16_TABLE, dtype=np.uint16)
+        out = np.empty((b1 - b0, 8), dtype=np.uint16)
+        c = self._chunks(np.arange(b0, b1))
+        for i in range(8):
+            out[:, i] = c
+            c = (c << 8) ^ table[(c >> 8) ^ blk[:, i]]
+        return out.reshape(-1)[lo - b0 * 8:hi - b0 * 8 + 1]
+
+def crc16_spans(arr, spans: List[Tuple[int,int]]) -> List[int]:
+    """批量计算各 [start, end) 区间的 CRC-16：覆盖所有区间的连续区域只过一遍表（每 8 字节 4 次查表），
+    之后每个区间只是两个前缀值的一次移位合并，与帧长、帧数分布无关，也无需按最长帧补齐。"""
+    if not spans:
+        return []
+    lo = min(s for s, _ in spans)
+    hi = max(e for _, e in spans)
+    p = Crc16Prefix(arr[lo:hi]).at([s - lo for s, _ in spans] + [e - lo for _, e in spans])
+    n = len(spans)
+    c = crc16_shift_by(p[:n], [e - s for s, e in spans]) ^ p[n:]
+    return [int(x) for x in c]
+
+def tail_tags_start(buf, size: int, base: int = 0) -> int:
+    """文件末尾若有 ID3v1（TAG）或 APEv2（APETAGEX）标签，返回标签起点，否则返回 size。
+    buf 对应文件的 [base, size)，只需覆盖末尾的标签 footer。"""
+    end = size
+    if end - base >= 128 and bytes(buf[end-base-128:end-base-125]) == b'TAG':
+        end -= 128
+    if end - base >= 32 and bytes(buf[end-base-32:end-base-24]) == b'APETAGEX':
+        tag_size = int.from_bytes(bytes(buf[end-base-20:end-base-16]), 'little')
+        flags = int.from_bytes(bytes(buf[end-base-12:end-base-8]), 'little')
+        total = tag_size + (32 if flags & 0x80000000 else 0)
+        if 0 < total <= end:
+            end -= total
+    return end
+
+TAIL_WINDOW = 64 * 1024
+
+@dataclass
+class TailInfo:
+    size: int
+    tags_start: int           # 尾部 ID3v1/APEv2 标签起点；无标签时等于 size
+    audio_end: int            # 最后一个完整帧的结束偏移；窗口内没找到为 0
+    end_sample: int           # 最后一个完整帧的结束样本号
+    partial_frame: bool       # 完整帧之后跟着一个不完整的帧（拷贝中断），而不是垃圾数据
+    total_samples: int = 0    # STREAMINFO 记录的总样本数；0 表示未知
+
+    @property
+    def tag_bytes(self) -> int:
+        return self.size - self.tags_start
+
+    @property
+    def junk_bytes(self) -> int:
+        if not self.audio_end or self.partial_frame:
+            return 0
+        return self.tags_start - self.audio_end
+
+    @property
+    def cut_at(self) -> int:
+        """截断修复的目标长度：有垃圾数据时截到末帧结尾，否则只去掉标签。"""
+        return self.audio_end if self.junk_bytes else self.tags_start
+
+    @property
+    def missing_samples(self) -> int:
+        """最后一个完整帧之后、STREAMINFO 声称还应有的样本数；>0 即流被截断（拷贝中断等）。"""
+        if not self.audio_end or not self.total_samples:
+            return 0
+        return max(0, self.total_samples - self.end_sample)
+
+class SpanCrc:
+    """尾部窗口内任意区间的 CRC-16，建立在 Crc16Prefix 上：每个区间只求两个前缀值再做一次标量移位，
+    找“累积 CRC 归零”的位置是一次连续前缀加一次向量比较。没有 numpy 时退回逐字节计算，结论相同。"""
+    def __init__(self, data: bytes):
+        self.data = data
+        try:
+            import numpy as np
+        except ImportError:
+            self.prefix = None
+            return
+        self.prefix = Crc16Prefix(np.frombuffer(data, dtype=np.uint8))
+
+    def crc(self, start: int, end: int) -> int:
+        if self.prefix is None:
+            return crc16(self.data[start:end])
+        ps, pe = (int(x) for x in self.prefix.at([start, end]))
+        return pe ^ crc16_advance(ps, end - start)
+
+    def zero_points(self, start: int, lo: int, hi: int) -> List[int]:
+        """lo < e <= hi 中 crc(start, e) == 0 的全部 e（即以 e 结尾的帧 CRC-16 正确），从小到大。"""
+        if lo >= hi:
+            return []
+        if self.prefix is None:
+            out, c = [], crc16(self.data[start:lo])
+            for i in range(lo, hi):
+                c = ((c << 8) & 0xFFFF) ^ CRC16_TABLE[(c >> 8) ^ self.data[i]]
+                if c == 0:
+                    out.append(i + 1)
+            return out
+        import numpy as np
+        p = self.prefix.run(lo + 1, hi)
+        ends = np.arange(lo + 1, hi + 1)
+        base = np.full(len(ends), self.prefix.at([start])[0], dtype=np.uint16)
+        return [int(e) for e in ends[crc16_shift_by(base, ends - start) == p]]
+
+def inspect_tail(read_at: Callable[[int, int], bytes], size: int, audio_offset: int, si: StreamInfo) -> TailInfo:
+    """只读文件末尾几十 KB：识别尾部标签，并从后往前找最后一个完整帧，区分垃圾数据与被截断的帧。"""
+    foot = max(0, size - 160)
+    tags_start = tail_tags_start(read_at(foot, size - foot), size, foot)
+    span = max(TAIL_WINDOW, 2 * si.max_framesize + 64)
+    base = max(audio_offset, tags_start - span)
+    data = read_at(base, tags_start - base)
+    n = len(data)
+    headers: List[FrameHeader] = []
+    pos = data.find(b'\xff')
+    while 0 <= pos < n - 1:
+        h = parse_frame_header(data, pos, si) if data[pos+1] & 0xFE == 0xF8 else None
+        if h is not None:
+            headers.append(h)
+        pos = data.find(b'\xff', pos + 1)
+    info = TailInfo(size, tags_start, 0, 0, False, si.total_samples)
+    if not headers:
+        return info
+    # 常见情况：最后一个帧恰好延伸到数据末尾
+    spans = SpanCrc(data)
+    for h in reversed(headers):
+        if spans.crc(h.offset, n) == 0:
+            # 末尾补零时 CRC 会一直保持为 0：从零串开头往后最多再走两字节（帧 CRC 本身可能是 0x00）找真正的帧尾
+            end = len(data.rstrip(b'\x00'))
+            c = spans.crc(h.offset, end)
+            while c != 0 and end < n:
+                c = crc16(b'\x00', c)
+                end += 1
+            info.audio_end, info.end_sample = base + end, h.first_sample(si) + h.blocksize
+            return info
+    # 否则从后往前找最后一个完整帧：
+    # - 后面紧跟着样本号连续的帧头：那个帧不完整（拷贝中断），完整帧到它开头为止；
+    # - 没有后继帧：CRC-16 中途归零处即帧尾，其后是垃圾数据。为排除偶然归零，要求该帧是整条流的最后一帧
+    #   （结束样本号等于 total_samples），且前一帧恰好在它开头结束、样本号连续
+    for i in range(len(headers) - 1, -1, -1):
+        h = headers[i]
+        end_sample = h.first_sample(si) + h.blocksize
+        nxt = next((g for g in headers[i+1:] if g.first_sample(si) == end_sample
+                    and spans.crc(h.offset, g.offset) == 0), None)
+        if nxt is not None:
+            info.audio_end, info.end_sample, info.partial_frame = base + nxt.offset, end_sample, True
+            return info
+        if si.total_samples and end_sample != si.total_samples:
+            continue
+        lo = h.offset + max(h.header_len + 2, si.min_framesize)
+        hi = min(n, h.offset + si.max_framesize) if si.max_framesize else n
+        end = next(iter(spans.zero_points(h.offset, lo - 1, hi)), None)
+        if end is None:
+            continue
+        prev = headers[i-1] if i else None
+        if prev is not None and not (spans.crc(prev.offset, h.offset) == 0
+                                     and prev.first_sample(si) + prev.blocksize == h.first_sample(si)):
+            continue
+        info.audio_end, info.end_sample = base + end, end_sample
+        return info
+    return info
+
+def read_tail(read_at: Callable[[int, int], bytes], probe: FlacProbe) -> Optional[TailInfo]:
+    if not can_remux(probe):
+        return None
+    return inspect_tail(read_at, probe.file_size, probe.audio_offset, probe.streaminfo)
+
+SEEK_PLACEHOLDER = 0xFFFFFFFFFFFFFFFF
+SEEK_CHECK_POINTS = 64  # 点很多时均匀抽查这么多个点的帧头；越界与乱序按表内数字全部检查
+
+@dataclass
+class SeekCheck:
+    points: int   # 非占位的 seek point 数
+    checked: int  # 实际读帧头核对的点数
+    bad: int      # 越界、乱序或指向处不是对应帧头的点数
+    reason: str   # 第一个问题的描述
+
+def seek_points(data: bytes) -> List[Tuple[int, int, int]]:
+    """SEEKTABLE 数据体 -> [(样本号, 相对首帧的字节偏移, 帧样本数)]，跳过占位点。"""
+    out = []
+    for i in range(0, len(data) - 17, 18):
+        sample = int.from_bytes(data[i:i+8], 'big')
+        if sample != SEEK_PLACEHOLDER:
+            out.append((sample, int.from_bytes(data[i+8:i+16], 'big'), int.from_bytes(data[i+16:i+18], 'big')))
+    return out
+
+def check_seektable(read_at: Callable[[int, int], bytes], probe: FlacProbe, audio_end: int,
+                    end_sample: int) -> Optional[SeekCheck]:
+    """核对 SEEKTABLE：样本号递增、不越过实际音频结尾，并抽查各点偏移处确有样本号相符的帧头。
+    audio_end / end_sample 为最后一个完整帧的结束偏移与样本号（截断的文件以实际长度为准）。没有 SEEKTABLE 返回 None。"""
+    tables = [b for b in probe.blocks if b.type == 3]
+    si = probe.streaminfo
+    if not tables or si is None or not probe.audio_offset:
+        return None
+    if len(tables) > 1:
+        return SeekCheck(0, 0, 1, f'{len(tables)} 个 SEEKTABLE 块')
+    block = tables[0]
+    if block.length % 18:
+        return SeekCheck(0, 0, 1, f'长度 {block.length} 不是 18 的倍数')
+    points = seek_points(read_at(block.offset + 4, block.length))
+    bad, reason, prev = set(), '', -1
+    for i, (sample, offset, _) in enumerate(points):
+        if sample <= prev:
+            bad.add(i); reason = reason or f'样本号未递增 @ {sample}'
+        elif sample >= end_sample or probe.audio_offset + offset >= audio_end:
+            bad.add(i); reason = reason or f'越过音频结尾 @ {sample}'
+        prev = max(prev, sample)
+    step = max(1, -(-len(points) // SEEK_CHECK_POINTS))
+    sampled = [i for i in range(0, len(points), step) if i not in bad]
+    if points and len(points) - 1 not in bad and sampled[-1:] != [len(points) - 1]:
+        sampled.append(len(points) - 1)
+    for i in sampled:
+        sample, offset, nsamples = points[i]
+        h = parse_frame_header(read_at(probe.audio_offset + offset, 16), 0, si)
+        if h is None or h.first_sample(si) != sample or (nsamples and h.blocksize != nsamples):
+            bad.add(i); reason = reason or f'偏移 {offset} 处不是样本 {sample} 的帧头'
+    return SeekCheck(len(points), len(sampled), len(bad), reason)
+
+def read_seektable(read_at: Callable[[int, int], bytes], probe: FlacProbe,
+                   tail: Optional[TailInfo]) -> Optional[SeekCheck]:
+    if not can_remux(probe) or not any(b.type == 3 for b in probe.blocks):
+        return None
+    si = probe.streaminfo
+    audio_end = tail.audio_end if tail is not None and tail.audio_end else probe.file_size
+    end_sample = tail.end_sample if tail is not None and tail.audio_end else si.total_samples or SEEK_PLACEHOLDER
+    return check_seektable(read_at, probe, audio_end, end_sample)
+
+def probe_file(path: Path, backend: str = 'pread') -> Tuple[FlacProbe, Optional[TailInfo], Optional[SeekCheck]]:
+    """打开一次文件完成全部只读探测：头部元数据、末尾几十 KB、每个 seek point 一个帧头。
+    三者共用同一个 fd，尾部与 SEEKTABLE 的读取也计入 probe.io_calls。"""
+    with path.open('rb', buffering=0) as f:
+        probe = _parse_open(f, backend)
+        pread = pread_at(f.fileno())
+        calls = 0
+        def read_at(offset: int, n: int) -> bytes:
+            nonlocal calls
+            calls += PREAD_IO_CALLS
+            return pread(offset, n)
+        tail = read_tail(read_at, probe)
+        seek = read_seektable(read_at, probe, tail)
+    probe.io_calls += calls
+    return probe, tail, seek
+
+@dataclass
+class FrameScan:
+    frames: int
+    bad_offsets: List[int]  # CRC-16 不符或帧序号断档处的字节偏移
+    end_sample: int         # 最后一个有效帧的结束样本号
+    audio_end: int          # 最后一个有效帧的结束偏移
+
+def scan_frames(path: Path, probe: FlacProbe) -> Optional[FrameScan]:
+    """逐帧检查音频区：定位同步码、解析帧头（CRC-8），再批量校验每帧 CRC-16。不做 PCM 解码。"""
+    import mmap
+    import numpy as np
+    si = probe.streaminfo
+    if si is None or probe.audio_offset <= 0:
+        return None
+    with path.open('rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size <= probe.audio_offset:
+            return FrameScan(0, [probe.audio_offset], 0, probe.audio_offset)
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            arr = np.frombuffer(mm, dtype=np.uint8)
+            tail = inspect_tail(lambda o, n: mm[o:o+n], size, probe.audio_offset, si)
+            # 尾部标签/垃圾数据不算音频；被截断的不完整末帧也不算损坏帧，截断由 TailInfo.missing_samples 另行报告
+            end = tail.audio_end if tail.partial_frame else tail.cut_at
+            frames = walk_frames(mm, find_sync_candidates(arr, probe.audio_offset, end), si)
+            bad: List[int] = []
+            if not frames or frames[0].offset != probe.audio_offset:
+                bad.append(probe.audio_offset)
+            spans = [(h.offset, frames[i+1].offset if i + 1 < len(frames) else end) for i, h in enumerate(frames)]
+            end_sample, audio_end = 0, probe.audio_offset
+            for i, c in enumerate(crc16_spans(arr, spans)):
+                h = frames[i]
+                if c != 0:
+                    bad.append(h.offset)
+                    continue
+                if i and h.first_sample(si) != frames[i-1].first_sample(si) + frames[i-1].blocksize:
+                    bad.append(spans[i-1][1])  # 中间有帧丢失
+                end_sample = h.first_sample(si) + h.blocksize
+                audio_end = spans[i][1]
+            del arr
+        finally:
+            try:
+                mm.close()
+            except BufferError:
+                pass
+    return FrameScan(len(frames), bad, end_sample, audio_end)
+
+def frame_crc_ok(path: Path) -> Tuple[bool,str]:
+    """可在进程池中执行的帧级校验，只回传简短结论。"""
+    try:
+        probe = parse_flac(path)
+        scan = scan_frames(path, probe)
+    except ImportError as e:
+        return False, f"numpy import failed: {e}"
+    except Exception as e:
+        return False, f"CRC_FAIL: {e.__class__.__name__}: {e}"
+    if scan is None:
+        return False, 'CRC_FAIL: 无法定位 STREAMINFO 或音频帧'
+    if scan.bad_offsets:
+        shown = ', '.join(str(o) for o in scan.bad_offsets[:5])
+        more = f' 等 {len(scan.bad_offsets)} 处' if len(scan.bad_offsets) > 5 else ''
+        return False, f'CRC_FAIL: 损坏帧偏移 {shown}{more}'
+    si = probe.streaminfo
+    if si.total_samples and scan.end_sample < si.total_samples:
+        missing = si.total_samples - scan.end_sample
+        return True, f'OK (帧 CRC, {scan.frames} 帧; 流被截断，缺少 {missing} 个样本)'
+    return True, f'OK (帧 CRC, {scan.frames} 帧)'
 
 # ---------------------------- 判定与修复策略 ----------------------------
 
@@ -135,83 +980,516 @@ def soundfile_decode_ok(path: Path, chunk_frames: int = 65536) -> Tuple[bool,str
 class FixPlan:
     needs_fix: bool
     reasons: List[str]
-    action: str  # 'ffmpeg' | 'flac' | 'metaflac' | 'skip'
+    action: str  # 'strip' | 'truncate' | 'relength' | 'patch' | 'remux' | 'ffmpeg' | 'flac' | 'metaflac' | 'skip'
     keep_cover: bool
+    relength: bool = False  # 同时把 STREAMINFO 总样本数改写为实际长度，并截掉不完整的末帧
+    seektable: bool = False  # 丢掉原 SEEKTABLE，按实际帧位置重新生成
 
-def decide_fix(probe: FlacProbe, decode_ok: bool, keep_cover: bool, meta_threshold_mb: float, max_cover_bytes: int) -> FixPlan:
+def decide_fix(probe: FlacProbe, decode_ok: bool, keep_cover: bool, meta_threshold_mb: float, max_cover_bytes: int,
+               inplace: bool = True, md5_mismatch: bool = False, frames_ok: Optional[bool] = None,
+               tools: Optional['ToolRegistry'] = None, tail: Optional[TailInfo] = None,
+               fix_length: bool = False, seek: Optional[SeekCheck] = None, rebuild_seektable: bool = False) -> FixPlan:
+    """frames_ok 为帧级 CRC 结论：解码失败但帧全部完好，说明只是头部问题，仍可走 remux/patch。
+    tail 为尾部检查结果：尾部标签/垃圾数据在 remux/patch 时一并截掉。
+    流被截断时只报告缺少的时长；fix_length 为真才按实际长度改写 STREAMINFO（relength）。
+    seek 为 SEEKTABLE 核对结果：有坏点时按结构问题处理并重建；rebuild_seektable 为真时凡是重写头部/重编码都重建。"""
     reasons: List[str] = []
-    if not decode_ok:
+    if md5_mismatch:
+        # 能解码但样本与原始签名不符：音频已静默损坏，重新编码只会把坏数据固化下来
+        reasons.append('STREAMINFO MD5 不符（音频数据已损坏）')
+    elif not decode_ok:
         reasons.append('解码失败/播放器拒绝播放')
+    if frames_ok is False:
+        reasons.append('音频帧 CRC 损坏')
+    audio_intact = frames_ok if frames_ok is not None else decode_ok
+    tools = tools or default_tools()
+    prefix = probe.stream_offset > 0
+    if prefix:
+        reasons.append(f'文件开头有 ID3v2 标签: {human_bytes(probe.stream_offset)}')
+    trailing = tail is not None and tail.cut_at < tail.size
+    if tail is not None and tail.tag_bytes:
+        reasons.append(f'尾部有 ID3v1/APEv2 标签: {human_bytes(tail.tag_bytes)}')
+    if tail is not None and tail.junk_bytes:
+        reasons.append(f'末帧之后有 {human_bytes(tail.junk_bytes)} 垃圾数据')
+    truncated = tail is not None and tail.missing_samples > 0
+    if truncated:
+        si = probe.streaminfo
+        reasons.append(f'流被截断: 缺少 {tail.missing_samples / si.sample_rate:.3f} 秒'
+                       f'（STREAMINFO {si.total_samples} 个样本，实际到 {tail.end_sample}）')
+    relength = truncated and fix_length
+    before_meta = len(reasons)
     if probe.unknown_block_count > 0:
         reasons.append(f'存在 UNKNOWN 元数据块: {probe.unknown_block_count} 个')
     if not probe.last_block_marked:
         reasons.append('元数据未标记终止 is_last=false')
     if probe.total_meta_bytes_with_headers > int(meta_threshold_mb*1024*1024):
         reasons.append(f'元数据过大: {human_bytes(probe.total_meta_bytes_with_headers)}')
+    if seek is not None and seek.bad:
+        reasons.append(f'SEEKTABLE 无效: {seek.bad}/{seek.points} 个点（{seek.reason}）')
     if probe.picture_bytes_total > max_cover_bytes:
         reasons.append(f'封面过大: {human_bytes(probe.picture_bytes_total)} > {human_bytes(max_cover_bytes)}')
 
+    if keep_cover and probe.picture_bytes_total > max_cover_bytes:
+        keep_cover = False
+
+    meta_ok = len(reasons) == before_meta
     needs_fix = len(reasons) > 0
     action = 'skip'
-    if needs_fix:
-        if which('ffmpeg'):
-            action = 'ffmpeg'
-        elif which('flac'):
-            action = 'flac'
+    if needs_fix and not md5_mismatch:
+        if prefix and not trailing and not truncated and meta_ok and audio_intact:
+            # 元数据本身没问题，只多了个 ID3 前缀（解码器可能因此拒绝打开）：
+            # 从 'fLaC' 起整段原样拷贝，元数据与音频一个字节都不动
+            action = 'strip'
+        elif relength and inplace and not prefix and meta_ok and audio_intact:
+            # 拷贝中断：只改写 STREAMINFO 的 34 字节并截掉不完整的末帧，音频帧不动
+            action = 'relength'
+        elif truncated and not relength:
+            # 缺失的音频找不回来；不加 --fix-length 时只报告，其他问题也先不动（修完仍是截断的流，验证过不了）
+            action = 'skip'
+        elif trailing and not prefix and meta_ok and audio_intact:
+            # 只是末尾多出标签/垃圾数据：ftruncate 即可，O(1) I/O
+            action = 'truncate'
+        elif audio_intact and can_remux(probe):
+            # 纯结构问题：只重写元数据头，音频帧原样保留；新头放得进原位置则就地改写
+            action = 'patch' if inplace and inplace_slack(probe, keep_cover) is not None else 'remux'
+        elif tools.encoders():
+            action = tools.encoders()[0]
         else:
-            action = 'metaflac' if which('metaflac') else 'skip'
+            action = 'metaflac' if tools.has('metaflac') else 'skip'
 
-    if needs_fix and '封面过大' in ' '.join(reasons) and which('metaflac') and not which('ffmpeg') and not which('flac'):
-        action = 'metaflac'
+    seektable = (action in ('patch', 'remux', 'ffmpeg', 'flac')
+                 and (rebuild_seektable or (seek is not None and seek.bad > 0)))
+    return FixPlan(needs_fix, reasons, action, keep_cover, relength and action in ('relength', 'patch', 'remux'), seektable)
 
-    if keep_cover and probe.picture_bytes_total > max_cover_bytes:
-        keep_cover = False
+# ---------------------------- 无损 remux ----------------------------
 
-    return FixPlan(needs_fix, reasons, action, keep_cover)
+REMUX_PADDING = 4096
+INPLACE_MAX_SLACK = 64 * 1024  # 余量过大（如删掉大封面）时就地改写只会留下巨大 PADDING，改走 remux 缩小文件
 
-# ---------------------------- 外部命令封装 ----------------------------
+def can_remux(probe: FlacProbe) -> bool:
+    return (probe.audio_offset > 0 and probe.streaminfo is not None
+            and bool(probe.blocks) and probe.blocks[0].type == 0)
 
-def run(cmd: List[str]) -> Tuple[int,str,str]:
-    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-    return p.returncode, p.stdout, p.stderr
+def select_blocks(probe: FlacProbe, keep_cover: bool, keep_seektable: bool = True) -> List[MetaBlock]:
+    """保留 STREAMINFO 及已知块；丢弃 UNKNOWN/PADDING，封面按 keep_cover 取舍，SEEKTABLE 要重建时丢弃。"""
+    keep: List[MetaBlock] = []
+    for b in probe.blocks:
+        if b.type not in TYPE_NAMES or b.type == 1:
+            continue
+        if b.type == 3 and not keep_seektable:
+            continue
+        if b.type == 0 and keep:
+            continue  # 重复 STREAMINFO
+        if b.type == 6 and not keep_cover:
+            continue
+        keep.append(b)
+    return keep
+
+def block_header(btype: int, length: int, is_last: bool) -> bytes:
+    return bytes([(0x80 if is_last else 0) | btype]) + length.to_bytes(3, 'big')
+
+def pack_streaminfo(si: StreamInfo) -> bytes:
+    """StreamInfo -> 34 字节 STREAMINFO 数据体。"""
+    x = (si.sample_rate << 44) | ((si.channels - 1) << 41) | ((si.bits_per_sample - 1) << 36) | si.total_samples
+    return (si.min_blocksize.to_bytes(2, 'big') + si.max_blocksize.to_bytes(2, 'big')
+            + si.min_framesize.to_bytes(3, 'big') + si.max_framesize.to_bytes(3, 'big')
+            + x.to_bytes(8, 'big') + (si.md5 or bytes(16)))
+
+def relength_streaminfo(si: StreamInfo, total_samples: int) -> bytes:
+    """总样本数改为实际长度的 STREAMINFO 数据体；原 MD5 覆盖的是完整音频，必然不再成立，清零表示未设置。"""
+    return pack_streaminfo(replace(si, total_samples=total_samples, md5=bytes(16)))
+
+SEEK_INTERVAL_SECONDS = 10
+
+def seektable_block(frames: List[Tuple[int, int, int]], interval_samples: int) -> bytes:
+    """frames 为 (首样本号, 相对首帧的字节偏移, 帧样本数)，按 interval 取点生成 SEEKTABLE 数据体。"""
+    out = bytearray()
+    target = 0
+    for sample, offset, blocksize in frames:
+        if sample + blocksize <= target:
+            continue
+        out += sample.to_bytes(8, 'big') + offset.to_bytes(8, 'big') + blocksize.to_bytes(2, 'big')
+        target = ((sample + blocksize - 1) // interval_samples + 1) * interval_samples
+    return bytes(out)
 
-def export_cover_with_metaflac(src: Path, tmpdir: Path) -> Optional[Path]:
-    if not which('metaflac'):
+def index_frames(path: Path, probe: FlacProbe, audio_end: int = 0) -> Tuple[List[FrameHeader], int]:
+    """mmap 整个文件，找出 [audio_offset, audio_end) 内连续的帧链；返回 (帧头列表, 音频结尾偏移)。"""
+    import mmap
+    import numpy as np
+    with path.open('rb') as f:
+        end = audio_end or os.fstat(f.fileno()).st_size
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            frames = walk_frames(mm, find_sync_candidates(np.frombuffer(mm, dtype=np.uint8), probe.audio_offset, end),
+                                 probe.streaminfo)
+        finally:
+            try:
+                mm.close()
+            except BufferError:
+                pass
+    return frames, end
+
+def rebuild_seektable(path: Path, probe: FlacProbe, interval_seconds: float, audio_end: int = 0) -> Optional[bytes]:
+    """按实际帧位置重新生成 SEEKTABLE 数据体；帧链不从首帧开始或中途断档时返回 None（宁可不要也不写错的表）。"""
+    si = probe.streaminfo
+    frames, end = index_frames(path, probe, audio_end)
+    if not frames or frames[0].offset != probe.audio_offset:
         return None
-    out = tmpdir / 'cover.export'
-    code, _, _ = run(['metaflac', f'--export-picture-to={out}', str(src)])
-    if code == 0 and out.exists():
-        return out
+    for a, b in zip(frames, frames[1:]):
+        if b.first_sample(si) != a.first_sample(si) + a.blocksize:
+            return None
+    index = [(h.first_sample(si), h.offset - probe.audio_offset, h.blocksize) for h in frames]
+    return seektable_block(index, max(1, int(si.sample_rate * interval_seconds)))
+
+def inplace_slack(probe: FlacProbe, keep_cover: bool, keep_seektable: bool = True,
+                  extra_bytes: int = 0) -> Optional[int]:
+    """新元数据头放回原头部区间后的剩余字节；放不下（或余量不足以容纳 PADDING 头）返回 None。
+    extra_bytes 为追加块（含块头）的总长。"""
+    if not can_remux(probe):
+        return None
+    need = 4 + sum(4 + b.length for b in select_blocks(probe, keep_cover, keep_seektable)) + extra_bytes
+    slack = probe.audio_offset - need
+    if slack == 0 or 4 <= slack <= INPLACE_MAX_SLACK:
+        return slack
     return None
 
-def import_cover_with_metaflac(dst: Path, cover_path: Path) -> bool:
-    if not which('metaflac'):
-        return False
-    code, _, _ = run(['metaflac', f'--import-picture-from={cover_path}', str(dst)])
-    return code == 0
+def read_blocks(src_fd: int, blocks: List[MetaBlock]) -> List[Tuple[int, bytes]]:
+    """原样读出各块的数据体，返回 (type, data) 列表。"""
+    chunks: List[Tuple[int, bytes]] = []
+    for b in blocks:
+        os.lseek(src_fd, b.offset + 4, os.SEEK_SET)
+        data = os.read(src_fd, b.length)
+        if len(data) != b.length:
+            raise ValueError(f'元数据块截断: {TYPE_NAMES.get(b.type, b.type)} @ {b.offset}')
+        chunks.append((b.type, data))
+    return chunks
 
-def strip_all_metadata_with_metaflac(path: Path) -> bool:
-    if not which('metaflac'):
+def build_metadata(src_fd: int, blocks: List[MetaBlock], padding: Optional[int] = REMUX_PADDING,
+                   extra: Iterable[Tuple[int, bytes]] = (), streaminfo: Optional[bytes] = None) -> bytes:
+    """按 blocks 顺序拼出 'fLaC' + 元数据链（extra 为追加的现成块），末尾可附 PADDING（None 表示不加），
+    并正确设置 is_last。streaminfo 非空时替换原 STREAMINFO 数据体。"""
+    chunks = read_blocks(src_fd, blocks) + list(extra)
+    if streaminfo is not None:
+        chunks = [(t, streaminfo if t == 0 else data) for t, data in chunks]
+    if padding is not None:
+        chunks.append((1, bytes(padding)))
+    out = bytearray(b'fLaC')
+    for i, (btype, data) in enumerate(chunks):
+        out += block_header(btype, len(data), i == len(chunks) - 1)
+        out += data
+    return bytes(out)
+
+def remux_flac(src: Path, dst: Path, probe: FlacProbe, keep_cover: bool,
+               extra: Iterable[Tuple[int, bytes]] = (), audio_end: int = 0, streaminfo: Optional[bytes] = None,
+               keep_seektable: bool = True) -> bool:
+    """写入干净的元数据头后，把音频帧逐字节拷贝到 dst（不重新编码）；audio_end 非 0 时丢掉其后的尾部数据。"""
+    if not can_remux(probe):
         return False
-    code, _, _ = run(['metaflac', '--remove-all', '--dont-use-padding', str(path)])
+    sfd = os.open(str(src), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(sfd).st_size
+        header = build_metadata(sfd, select_blocks(probe, keep_cover, keep_seektable), extra=extra, streaminfo=streaminfo)
+        audio_len = (audio_end or size) - probe.audio_offset
+        dfd = os.open(str(dst), os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            os.write(dfd, header)
+            copied = copy_range(sfd, dfd, probe.audio_offset, audio_len)
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    finally:
+        os.close(sfd)
+    return copied == audio_len
+
+def strip_prefix(src: Path, dst: Path, offset: int) -> bool:
+    """把 src 从 offset 起的全部内容拷到 dst（丢掉 ID3v2 等前缀），内核态拷贝，一次顺序读。"""
+    sfd = os.open(str(src), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        count = os.fstat(sfd).st_size - offset
+        dfd = os.open(str(dst), os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            copied = copy_range(sfd, dfd, offset, count)
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    finally:
+        os.close(sfd)
+    return copied == count
+
+def read_pictures(src: Path, probe: FlacProbe) -> List[Tuple[int, bytes]]:
+    """原样取出所有 PICTURE 块（含 MIME、描述、尺寸等字段）。"""
+    pics = [b for b in probe.blocks if b.type == 6]
+    if not pics:
+        return []
+    fd = os.open(str(src), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        return read_blocks(fd, pics)
+    finally:
+        os.close(fd)
+
+# ---------------------------- 外部命令封装 ----------------------------
+
+def run(cmd: List[str]) -> Tuple[int,str,str]:
+    p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, errors='replace')
+    return p.returncode, p.stdout, p.stderr
+
+@dataclass
+class ToolInfo:
+    name: str
+    path: Optional[str]
+    version: Tuple[int, ...] = ()
+    version_text: str = ''
+    caps: Tuple[str, ...] = ()  # 如 'multithread'（flac >= 1.5 的 -j）、'flac_encoder'（ffmpeg 内置 flac 编码器）
+
+def _parse_version(text: str) -> Tuple[int, ...]:
+    import re
+    m = re.search(r'(\d+)\.(\d+)(?:\.(\d+))?', text)
+    return tuple(int(g) for g in m.groups() if g is not None) if m else ()
+
+class ToolRegistry:
+    """启动时一次性解析外部工具路径、版本与能力；之后所有规划/修复函数只查这里，不再逐文件扫 PATH。"""
+    TOOLS = ('ffmpeg', 'flac', 'metaflac')
+
+    def __init__(self, tools: Dict[str, ToolInfo], use: str = 'auto'):
+        self.tools = tools
+        self.use = use
+
+    @classmethod
+    def discover(cls, use: str = 'auto') -> 'ToolRegistry':
+        tools: Dict[str, ToolInfo] = {}
+        for name in cls.TOOLS:
+            path = which(name)
+            info = ToolInfo(name, path)
+            if path:
+                try:
+                    code, out, err = run([path, '-version' if name == 'ffmpeg' else '--version'])
+                    first = (out or err).strip().splitlines()
+                    info.version_text = first[0] if first else ''
+                    info.version = _parse_version(info.version_text.split('version', 1)[-1])
+                except OSError:
+                    info.path = None
+            tools[name] = info
+        ff, fl = tools['ffmpeg'], tools['flac']
+        if ff.path:
+            code, out, _ = run([ff.path, '-hide_banner', '-h', 'encoder=flac'])
+            if code == 0 and 'flac' in out.lower() and 'unknown encoder' not in out.lower():
+                ff.caps += ('flac_encoder',)
+        if fl.path and fl.version >= (1, 5):
+            fl.caps += ('multithread',)
+        return cls(tools, use)
+
+    def path(self, name: str) -> Optional[str]:
+        info = self.tools.get(name)
+        return info.path if info else None
+
+    def has(self, name: str, cap: str = '') -> bool:
+        info = self.tools.get(name)
+        return bool(info and info.path and (not cap or cap in info.caps))
+
+    def encoders(self) -> List[str]:
+        """按 --use 偏好排列的可用重编码工具；偏好的工具不可用时退化为其它工具。"""
+        order = ['flac', 'ffmpeg'] if self.use == 'flac' else ['ffmpeg', 'flac']
+        return [n for n in order if self.has(n, 'flac_encoder' if n == 'ffmpeg' else '')]
+
+    def describe(self) -> str:
+        return ', '.join(f"{n} {'.'.join(map(str, t.version)) or '?'}" + (f" [{','.join(t.caps)}]" if t.caps else '')
+                         for n, t in self.tools.items() if t.path) or '无'
+
+_DEFAULT_TOOLS: Optional[ToolRegistry] = None
+
+def default_tools() -> ToolRegistry:
+    global _DEFAULT_TOOLS
+    if _DEFAULT_TOOLS is None:
+        _DEFAULT_TOOLS = ToolRegistry.discover()
+    return _DEFAULT_TOOLS
+
+def strip_all_metadata_with_metaflac(path: Path, metaflac: str = 'metaflac') -> bool:
+    code, _, _ = run([metaflac, '--remove-all', '--dont-use-padding', str(path)])
     return code == 0
 
 # ---------------------------- 重封装实现 ----------------------------
 
-def reencode_with_ffmpeg(src: Path, dst: Path) -> bool:
-    cmd = ['ffmpeg','-y','-hide_banner','-loglevel','error','-i',str(src),'-map_metadata','0','-vn','-sn','-c:a','flac','-compression_level','5',str(dst)]
+def last_line(err: str) -> str:
+    """外部工具 stderr 的最后一个非空行，附在结果说明后面便于定位失败原因。"""
+    lines = [ln.strip() for ln in err.splitlines() if ln.strip()]
+    return lines[-1] if lines else ''
+
+def reencode_with_ffmpeg(src: Path, dst: Path, ffmpeg: str = 'ffmpeg') -> Tuple[bool,str]:
+    cmd = [ffmpeg,'-y','-hide_banner','-loglevel','error','-i',str(src),'-map_metadata','0','-vn','-sn','-c:a','flac','-compression_level','5',str(dst)]
+    code, _, err = run(cmd)
+    return code == 0, last_line(err)
+
+def run_pipe(producer: List[str], consumer: List[str]) -> Tuple[int,int,str]:
+    """producer 的 stdout 直接接到 consumer 的 stdin（OS 管道，不落盘）；返回两端退出码与合并的 stderr。"""
+    p1 = subprocess.Popen(producer, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        p2 = subprocess.Popen(consumer, stdin=p1.stdout, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except OSError:
+        p1.kill(); p1.wait()
+        raise
+    p1.stdout.close()  # consumer 提前退出时 producer 能收到 SIGPIPE/写失败而结束
+    err1: List[bytes] = []
+    t = threading.Thread(target=lambda: err1.append(p1.stderr.read()), daemon=True)
+    t.start()
+    _, err2 = p2.communicate()
+    if p2.returncode != 0 and p1.poll() is None:
+        p1.kill()
+    p1.wait()
+    t.join()
+    p1.stderr.close()
+    err = b''.join(err1) + (err2 or b'')
+    return p1.returncode, p2.returncode, err.decode('utf-8', 'replace')
+
+def reencode_with_flac_cli(src: Path, dst: Path, flac: str = 'flac', si: Optional[StreamInfo] = None,
+                           threads: int = 1) -> Tuple[bool,str]:
+    """flac -d -c 解码到管道，另一个 flac 从 stdin 编码，无临时 WAV；返回 (是否成功, 两端 stderr 的最后一行)。
+    已知 STREAMINFO 时走 raw PCM，避免超 4GB 时 WAV 头长度字段溢出；threads > 1 需 flac >= 1.5（-j）。"""
+    dec = [flac, '-d', '-c', '-s']
+    enc = [flac, '-s', '-f', '-o', str(dst)]
+    if threads > 1:
+        enc += ['-j', str(threads)]
+    if si is not None:
+        raw = ['--force-raw-format', '--endian=little', '--sign=signed']
+        dec += raw
+        enc += raw + [f'--channels={si.channels}', f'--bps={si.bits_per_sample}', f'--sample-rate={si.sample_rate}']
+    code1, code2, err = run_pipe(dec + [str(src)], enc + ['-'])
+    return code1 == 0 and code2 == 0 and dst.exists(), last_line(err)
+
+# ---------------------------- 并行分段编码 ----------------------------
+
+MT_BLOCKSIZE = 4096  # 分段边界对齐到块长，拼接后除末帧外都是满块
+
+def crc16_advance(c: int, nbytes: int) -> int:
+    """CRC 寄存器再吃进 nbytes 个 0 字节后的值，按 2 的幂分解查表。"""
+    step = 1
+    while nbytes:
+        if nbytes & 1:
+            c = int(_crc16_shift(step)[c])
+        nbytes >>= 1
+        step *= 2
+    return c
+
+def encode_frame_number(n: int) -> bytes:
+    """FLAC 帧头里的 UTF-8 风格变长整数。"""
+    if n < 0x80:
+        return bytes([n])
+    extra = 1
+    while n >= 1 << (6 * extra + 6 - extra):
+        extra += 1
+    out = [0x80 | ((n >> (6 * i)) & 0x3F) for i in range(extra)][::-1]
+    lead = ((0xFF00 >> (extra + 1)) & 0xFF) | (n >> (6 * extra))
+    return bytes([lead] + out)
+
+def renumber_frame(frame: bytes, h: FrameHeader, number: int) -> bytes:
+    """改写帧号并重算 CRC-8/CRC-16；帧体不动，CRC-16 利用线性性增量修正，不逐字节重算。"""
+    b = frame[4]
+    num_len = 1 if b < 0x80 else 8 - (b ^ 0xFF).bit_length()
+    old_hdr = frame[:h.header_len]
+    new_hdr = frame[:4] + encode_frame_number(number) + frame[4 + num_len:h.header_len - 1]
+    new_hdr += bytes([crc8(new_hdr)])
+    body_len = len(frame) - h.header_len
+    old_crc = int.from_bytes(frame[-2:], 'big')
+    delta = crc16(old_hdr) ^ crc16(new_hdr)
+    new_crc = old_crc ^ crc16_advance(delta, body_len - 2)
+    return new_hdr + frame[h.header_len:-2] + new_crc.to_bytes(2, 'big')
+
+def encode_piece(src: Path, dst: Path, start: int, end: int, tools: 'ToolRegistry', sample_rate: int) -> bool:
+    """把 [start, end) 样本区间编码成独立的 FLAC 片段（固定块长 MT_BLOCKSIZE）；编码器按 --use 偏好选取。"""
+    ranged = [n for n in tools.encoders() if n in ('flac', 'ffmpeg')]  # 能按样本区间编码的工具
+    tool = ranged[0] if ranged else ''
+    if tool == 'flac':
+        cmd = [tools.path('flac'), '-s', '-f', '-b', str(MT_BLOCKSIZE), f'--skip={start}', f'--until={end}',
+               '-o', str(dst), str(src)]
+    elif tool == 'ffmpeg':
+        # 输入端 -ss 让 demuxer 直接定位到区间附近，不必每段都从样本 0 解码；
+        # seek 点取区间前一个块内、换算成微秒恰为整数的样本号 s0，输出从 s0 精确开始，再由 atrim 按样本截取
+        q = sample_rate // math.gcd(sample_rate, 1000000)
+        s0 = max(0, start - MT_BLOCKSIZE) // q * q
+        us = s0 * 1000000 // sample_rate
+        cmd = [tools.path('ffmpeg'), '-y', '-hide_banner', '-loglevel', 'error', '-ss', f'{us // 1000000}.{us % 1000000:06d}',
+               '-i', str(src), '-map', '0:a:0', '-af', f'atrim=start_sample={start - s0}:end_sample={end - s0}',
+               '-c:a', 'flac', '-compression_level', '5', '-frame_size', str(MT_BLOCKSIZE), str(dst)]
+    else:
+        return False
     code, _, _ = run(cmd)
-    return code == 0
+    return code == 0 and dst.exists()
 
-def reencode_with_flac_cli(src: Path, dst: Path) -> bool:
-    # 在与目标同一目录创建临时文件，避免跨盘移动
-    with tempfile.TemporaryDirectory(dir=src.parent) as td:
-        wav = Path(td) / 'tmp.wav'
-        code, _, _ = run(['flac','-d','-f','-o',str(wav),str(src)])
-        if code != 0 or not wav.exists():
+def stitch_pieces(pieces: List[Path], dst: Path, si: StreamInfo, keep_md5: bool,
+                  seek_interval: float = SEEK_INTERVAL_SECONDS) -> bool:
+    """拼接各片段的音频帧：帧号顺延并修正 CRC，重建 STREAMINFO 与 SEEKTABLE。
+    源文件已验证无损时沿用原 MD5（PCM 不变）；否则编码器可能做了错误隐藏，MD5 置 0 表示未知。"""
+    plan: List[Tuple[Path, FlacProbe, List[FrameHeader], int]] = []
+    for p in pieces:
+        pr = parse_flac(p)
+        if not can_remux(pr):
             return False
-        code, _, _ = run(['flac','-f','-o',str(dst),str(wav)])
-        return code == 0 and dst.exists()
+        frames, size = index_frames(p, pr)
+        if not frames or frames[0].offset != pr.audio_offset or any(h.variable for h in frames):
+            return False
+        plan.append((p, pr, frames, size))
+    # 第一遍只看帧头：算出新帧长度，生成 STREAMINFO 与 SEEKTABLE
+    index: List[Tuple[int, int, int]] = []
+    sizes: List[int] = []
+    number = offset = 0
+    for _, pr, frames, size in plan:
+        for i, h in enumerate(frames):
+            end = frames[i + 1].offset if i + 1 < len(frames) else size
+            n = end - h.offset - (len(encode_frame_number(h.number)) - len(encode_frame_number(number)))
+            index.append((number * MT_BLOCKSIZE, offset, h.blocksize))
+            sizes.append(n)
+            offset += n
+            number += 1
+    total = sum(bs for _, _, bs in index)
+    if any(bs != MT_BLOCKSIZE for _, _, bs in index[:-1]) or (si.total_samples and total != si.total_samples):
+        return False
+    out_si = StreamInfo(si.sample_rate, si.channels, si.bits_per_sample, total, si.md5 if keep_md5 else bytes(16),
+                        MT_BLOCKSIZE, MT_BLOCKSIZE, min(sizes), max(sizes))
+    first = plan[0][1]
+    fd0 = os.open(str(plan[0][0]), os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        # 保留编码器写入的标签等块，STREAMINFO/SEEKTABLE 重建
+        # 编码器可能把源文件的 PICTURE 也拷了过来：一律丢掉，需要保留封面时由调用方从原文件嫁接
+        kept = read_blocks(fd0, [b for b in select_blocks(first, False) if b.type not in (0, 3)])
+    finally:
+        os.close(fd0)
+    chunks = [(0, pack_streaminfo(out_si)), (3, seektable_block(index, max(1, int(si.sample_rate * seek_interval))))] + kept
+    header = bytearray(b'fLaC')
+    chunks.append((1, bytes(REMUX_PADDING)))
+    for i, (btype, data) in enumerate(chunks):
+        header += block_header(btype, len(data), i == len(chunks) - 1) + data
+    number = 0
+    with dst.open('wb') as out:
+        out.write(header)
+        for p, _, frames, size in plan:
+            with p.open('rb') as f:
+                for i, h in enumerate(frames):
+                    end = frames[i + 1].offset if i + 1 < len(frames) else size
+                    f.seek(h.offset)
+                    out.write(renumber_frame(f.read(end - h.offset), h, number))
+                    number += 1
+        out.flush()
+        os.fsync(out.fileno())
+    return True
+
+def reencode_parallel(src: Path, dst: Path, si: StreamInfo, tools: 'ToolRegistry', threads: int, tmpdir: Path,
+                      keep_md5: bool = False, seek_interval: float = SEEK_INTERVAL_SECONDS) -> bool:
+    """按块长边界把 PCM 切成 threads 段，各段由独立的编码进程并行编码，再拼成一个文件。"""
+    total = si.total_samples
+    if total <= 0 or threads < 2:
+        return False
+    piece = -(-total // threads // MT_BLOCKSIZE) * MT_BLOCKSIZE or MT_BLOCKSIZE
+    ranges = [(s, min(s + piece, total)) for s in range(0, total, piece)]
+    pieces = [tmpdir / f'piece{i:03d}.flac' for i in range(len(ranges))]
+    with ThreadPoolExecutor(max_workers=len(ranges)) as ex:
+        oks = list(ex.map(lambda a: encode_piece(src, a[0], a[1][0], a[1][1], tools, si.sample_rate), zip(pieces, ranges)))
+    try:
+        return all(oks) and stitch_pieces(pieces, dst, si, keep_md5, seek_interval)
+    finally:
+        for p in pieces:
+            try:
+                p.unlink()
+            except OSError:
+                pass
 
 # ---------------------------- 文件替换 ----------------------------
 
@@ -240,45 +1518,807 @@ def atomic_replace(src: Path, dst: Path):
                     pass
             raise e
 
+def pwrite_all(fd: int, data: bytes, offset: int):
+    if hasattr(os, 'pwrite'):
+        done = 0
+        while done < len(data):
+            done += os.pwrite(fd, data[done:], offset + done)
+    else:  # Windows 没有 pwrite
+        os.lseek(fd, offset, os.SEEK_SET)
+        done = 0
+        while done < len(data):
+            done += os.write(fd, data[done:])
+
+def patch_header_inplace(path: Path, probe: FlacProbe, keep_cover: bool, streaminfo: Optional[bytes] = None,
+                         extra: Iterable[Tuple[int, bytes]] = (), keep_seektable: bool = True) -> Optional[bytes]:
+    """新元数据头与原头部等长（余量并入 PADDING）时，直接覆盖文件开头并 fsync。
+    成功返回被覆盖的原始头部，便于验证失败时回滚；放不下返回 None。"""
+    extra = list(extra)
+    slack = inplace_slack(probe, keep_cover, keep_seektable, sum(4 + len(d) for _, d in extra))
+    if slack is None:
+        return None
+    fd = os.open(str(path), os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    try:
+        header = build_metadata(fd, select_blocks(probe, keep_cover, keep_seektable), slack - 4 if slack else None,
+                                extra=extra, streaminfo=streaminfo)
+        if len(header) != probe.audio_offset:
+            return None
+        os.lseek(fd, 0, os.SEEK_SET)
+        original = os.read(fd, probe.audio_offset)
+        pwrite_all(fd, header, 0)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return original
+
+def rewrite_streaminfo(path: Path, probe: FlacProbe, data: bytes) -> bytes:
+    """就地覆盖 STREAMINFO 的 34 字节数据体并 fsync；返回原内容以便回滚。"""
+    offset = probe.blocks[0].offset + 4
+    fd = os.open(str(path), os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    try:
+        os.lseek(fd, offset, os.SEEK_SET)
+        original = os.read(fd, len(data))
+        pwrite_all(fd, data, offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return original
+
+def truncate_tail(path: Path, cut_at: int) -> bytes:
+    """就地截掉 cut_at 之后的尾部标签/垃圾数据并 fsync；返回被截掉的字节以便回滚。"""
+    fd = os.open(str(path), os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    try:
+        size = os.fstat(fd).st_size
+        os.lseek(fd, cut_at, os.SEEK_SET)
+        removed = os.read(fd, size - cut_at)
+        os.ftruncate(fd, cut_at)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    return removed
+
+def restore_tail(path: Path, cut_at: int, removed: bytes):
+    fd = os.open(str(path), os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    try:
+        pwrite_all(fd, removed, cut_at)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def restore_header(path: Path, original: bytes, offset: int = 0):
+    fd = os.open(str(path), os.O_RDWR | getattr(os, 'O_BINARY', 0))
+    try:
+        pwrite_all(fd, original, offset)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+# ---------------------------- 增量缓存 ----------------------------
+
+class ProbeCache:
+    """SQLite 持久缓存：以 (st_dev, st_ino) 为主键，size/mtime_ns/判定参数全一致才算命中。"""
+    CACHEABLE = ('OK', 'SKIP')  # 只复用“无需处理”的结论；需修复/失败的文件每次重新检查
+    COMMIT_EVERY = 500
+
+    def __init__(self, path: Path, settings: str):
+        self.settings = settings
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.warned = False
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('''CREATE TABLE IF NOT EXISTS files (
+            dev INTEGER NOT NULL, ino INTEGER NOT NULL, path TEXT NOT NULL,
+            size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, settings TEXT NOT NULL,
+            probe TEXT, decode_ok INTEGER, result TEXT NOT NULL,
+            PRIMARY KEY (dev, ino))''')
+
+    def get(self, path: Path, st: os.stat_result) -> Optional[Dict[str,Any]]:
+        with self.lock:
+            row = self.db.execute('SELECT size, mtime_ns, settings, result FROM files WHERE dev=? AND ino=?',
+                                  (st.st_dev, st.st_ino)).fetchone()
+        if row is None or row[0] != st.st_size or row[1] != st.st_mtime_ns or row[2] != self.settings:
+            return None
+        res = json.loads(row[3])
+        res['file'] = str(path)  # 文件可能被改名/移动，inode 不变即视为同一文件
+        res['message'] = '（缓存）' + res.get('message', '')
+        return res
+
+    def put(self, path: Path, st: os.stat_result, result: Dict[str,Any]):
+        probe = result.get('_probe')
+        summary = None
+        if probe is not None:
+            summary = {k: v for k, v in asdict(probe).items() if k != 'blocks'}
+            summary['block_count'] = len(probe.blocks)
+            if summary['streaminfo'] is not None:
+                summary['streaminfo']['md5'] = probe.streaminfo.md5.hex()  # bytes 不能直接 json.dumps
+        dec = result.get('_decode_ok')
+        public = {k: v for k, v in result.items() if not k.startswith('_')}
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?,?,?,?,?,?,?,?,?)',
+                            (st.st_dev, st.st_ino, str(path), st.st_size, st.st_mtime_ns, self.settings,
+                             json.dumps(summary, ensure_ascii=False) if summary else None,
+                             None if dec is None else int(dec), json.dumps(public, ensure_ascii=False)))
+            self.pending += 1
+            if self.pending >= self.COMMIT_EVERY:
+                self.db.commit()
+                self.pending = 0
+
+    def write_failed(self, e: Exception):
+        """缓存写入失败只提示一次；本次结论照常返回。"""
+        with self.lock:
+            if self.warned:
+                return
+            self.warned = True
+        print(f'[警告] 缓存写入失败，相关文件下次仍会重新检查: {e.__class__.__name__}: {e}', file=sys.stderr)
+
+    def prune(self) -> int:
+        """删除文件已不存在或已变化的条目，返回删除条数。"""
+        stale: List[Tuple[int,int]] = []
+        with self.lock:
+            rows = self.db.execute('SELECT dev, ino, path, size, mtime_ns FROM files').fetchall()
+        for dev, ino, p, size, mtime_ns in rows:
+            try:
+                st = os.stat(p)
+            except OSError:
+                stale.append((dev, ino)); continue
+            if (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns) != (dev, ino, size, mtime_ns):
+                stale.append((dev, ino))
+        with self.lock:
+            self.db.executemany('DELETE FROM files WHERE dev=? AND ino=?', stale)
+            self.db.commit()
+        return len(stale)
+
+    def close(self):
+        with self.lock:
+            self.db.commit()
+            self.db.close()
+
+CHECK_REVISION = 4  # 判定规则有变化（如新增尾部检查）时加一，旧缓存随之失效
+
+def cache_settings(args) -> str:
+    """影响判定结果的参数指纹；参数变化后旧缓存自动失效。"""
+    return json.dumps({'rev': CHECK_REVISION, 'keep_cover': args.keep_cover, 'max_cover_mb': args.max_cover_mb,
+                       'meta_threshold_mb': args.meta_threshold_mb, 'verify': args.verify,
+                       'level': args.level, 'sample_windows': args.sample_windows}, sort_keys=True)
+
+# ---------------------------- 运行日志 ----------------------------
+
+class RunJournal:
+    """只追加的 JSONL 运行日志：每个文件完成即写一行，按批 fsync；中断后可 --resume 跳过已完成的文件。
+    首行记录判定参数，参数不同的旧日志不用于续跑。"""
+    DONE = ('OK', 'FIXED', 'SKIP', 'FAIL', 'DRYRUN')  # ERROR 多为瞬时问题，续跑时重试
+    SYNC_EVERY = 64
+    SYNC_SECONDS = 2.0
+
+    def __init__(self, path: Path, settings: str, resume: bool = False):
+        self.path = path
+        self.settings = settings
+        self.done: Dict[str, Dict[str,Any]] = {}
+        self.stale = False  # 旧日志参数不一致
+        if resume and path.exists():
+            self.done = self._load()
+        self.fp = path.open('a' if resume else 'w', encoding='utf-8')
+        if self.fp.tell():
+            with path.open('rb') as fp:
+                fp.seek(-1, os.SEEK_END)
+                torn = fp.read(1) != b'\n'
+            if torn:
+                self.fp.write('\n')  # 崩溃时写了一半的末行：先补换行，新记录不会接在它后面
+        if self.fp.tell() == 0 or self.stale:
+            self._write({'journal': 1, 'settings': settings})
+            self._sync()
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def _load(self) -> Dict[str, Dict[str,Any]]:
+        done: Dict[str, Dict[str,Any]] = {}
+        with self.path.open('r', encoding='utf-8', errors='replace') as fp:
+            for line in fp:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的末行
+                if 'journal' in rec:
+                    # 中途改过参数的日志：只认最后一段与当前参数一致的记录
+                    self.stale = rec.get('settings') != self.settings
+                    if self.stale:
+                        done.clear()
+                elif not self.stale and rec.get('status') in self.DONE:
+                    done[rec['file']] = rec
+        return done
+
+    def lookup(self, path: Path) -> Optional[Dict[str,Any]]:
+        """上次已完成且文件未再变化时返回旧结果。"""
+        rec = self.done.get(str(path))
+        if rec is None:
+            return None
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if (st.st_size, st.st_mtime_ns) != (rec.get('size'), rec.get('mtime_ns')):
+            return None
+        res = {k: v for k, v in rec.items() if k not in ('size', 'mtime_ns')}
+        res['_resumed'] = True
+        return res
+
+    def append(self, result: Dict[str,Any]):
+        rec = {k: v for k, v in result.items() if not k.startswith('_')}
+        try:
+            st = os.stat(result['file'])  # 修复后的文件记录新的大小/mtime
+            rec['size'], rec['mtime_ns'] = st.st_size, st.st_mtime_ns
+        except OSError:
+            pass
+        self._write(rec)
+        self.pending += 1
+        if self.pending >= self.SYNC_EVERY or time.monotonic() - self.last_sync >= self.SYNC_SECONDS:
+            self._sync()
+
+    def _write(self, rec: Dict[str,Any]):
+        self.fp.write(json.dumps(rec, ensure_ascii=False) + '\n')
+
+    def _sync(self):
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.pending = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        self._sync()
+        self.fp.close()
+
+# ---------------------------- 报告输出 ----------------------------
+
+class StageClock:
+    """按阶段累计单调时钟耗时：lap(stage) 把上次打点以来的时间记到该阶段。
+    spans 另存每段的起止时刻与所在线程，供导出 Chrome trace。"""
+    def __init__(self):
+        self.t0 = self.last = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.spans: List[Tuple[str, float, float]] = []
+        self.thread = threading.current_thread()
+
+    def lap(self, stage: str):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.spans.append((stage, self.last, now))
+        self.last = now
+
+    def stop(self):
+        self.stages['total'] = time.perf_counter() - self.t0
+
+STAGES = ['probe', 'check', 'frames', 'backup', 'repair', 'verify', 'replace', 'total']
+
+class StageStats:
+    """各阶段耗时的对数分桶直方图（每翻倍 16 桶，相对误差约 2%），内存与文件数无关。"""
+    STEPS = 16
+
+    def __init__(self):
+        self.hist: Dict[str, Dict[int, int]] = {}
+        self.total: Dict[str, float] = {}
+
+    def add(self, stage: str, sec: float):
+        b = int(math.log2(max(sec * 1e6, 1.0)) * self.STEPS)  # 以微秒为单位分桶
+        h = self.hist.setdefault(stage, {})
+        h[b] = h.get(b, 0) + 1
+        self.total[stage] = self.total.get(stage, 0.0) + sec
+
+    def add_timings(self, timings: Dict[str, float]):
+        for stage, sec in timings.items():
+            self.add(stage, sec)
+
+    def percentile_ms(self, stage: str, q: float) -> float:
+        h = self.hist[stage]
+        rank = math.ceil(q / 100 * sum(h.values()))
+        acc = 0
+        for b in sorted(h):
+            acc += h[b]
+            if acc >= rank:
+                return 2 ** ((b + 0.5) / self.STEPS) / 1000  # 桶中点
+        return 0.0
+
+    def rows(self) -> List[Dict[str, Any]]:
+        order = [s for s in STAGES if s in self.hist] + sorted(set(self.hist) - set(STAGES))
+        out = []
+        for stage in order:
+            n = sum(self.hist[stage].values())
+            out.append({'stage': stage, 'n': n, 'total_s': self.total[stage], 'mean_ms': self.total[stage] / n * 1000,
+                        'p50_ms': self.percentile_ms(stage, 50), 'p95_ms': self.percentile_ms(stage, 95),
+                        'p99_ms': self.percentile_ms(stage, 99)})
+        return out
+
+class TraceWriter:
+    """流式写 Chrome trace（chrome://tracing / Perfetto 可直接打开），每个阶段一个 X 事件，按线程分行。"""
+    def __init__(self, path: Path):
+        self.path = path
+        self.fp = path.open('w', encoding='utf-8', buffering=1 << 16)
+        self.fp.write('[\n')
+        self.pid = os.getpid()
+        self.threads: Dict[int, str] = {}
+        self.first = True
+
+    def _event(self, ev: Dict[str, Any]):
+        self.fp.write(('' if self.first else ',\n') + json.dumps(ev, ensure_ascii=False))
+        self.first = False
+
+    def span(self, name: str, start: float, end: float, thread: threading.Thread, args: Dict[str, Any]):
+        tid = thread.ident or 0
+        if tid not in self.threads:
+            self.threads[tid] = thread.name
+            self._event({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': thread.name}})
+        self._event({'name': name, 'cat': 'stage', 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                     'ts': round(start * 1e6, 1), 'dur': round((end - start) * 1e6, 1), 'args': args})
+
+    def add(self, res: Dict[str, Any]):
+        clock: Optional[StageClock] = res.get('_clock')
+        if clock is None:
+            return
+        args = {'file': res['file'], 'status': res['status']}
+        for stage, start, end in clock.spans:
+            self.span(stage, start, end, clock.thread, args)
+
+    def close(self):
+        self.fp.write('\n]\n')
+        self.fp.close()
+
+class ThreadProfiler:
+    """cProfile 只统计启用它的线程：给每个工作线程各开一个，结束时合并导出。
+    Python 3.12 起 cProfile 基于全局的 sys.monitoring，同一时刻只能启用一个，但它会覆盖所有线程，
+    此时工作线程里启用失败即直接运行，由主线程的那个统一统计。"""
+    def __init__(self):
+        import cProfile
+        self._new = cProfile.Profile
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.profiles: List[Any] = []
+        self.main = self._add()
+        self.main.enable()
+
+    def _add(self):
+        prof = self._new()
+        with self.lock:
+            self.profiles.append(prof)
+        return prof
+
+    def wrap(self, fn: Callable[[Path], Dict[str,Any]]) -> Callable[[Path], Dict[str,Any]]:
+        def run(path: Path) -> Dict[str,Any]:
+            prof = getattr(self.local, 'prof', None)
+            if prof is None:
+                prof = self.local.prof = self._add()
+            try:
+                prof.enable()
+            except ValueError:
+                return fn(path)
+            try:
+                return fn(path)
+            finally:
+                prof.disable()
+        return run
+
+    def dump(self, path: Path):
+        import pstats
+        self.main.disable()
+        stats = None
+        for prof in self.profiles:
+            try:
+                stats = pstats.Stats(prof) if stats is None else stats.add(prof)
+            except TypeError:
+                continue  # 从未启用过的 profile 没有数据
+        if stats is not None:
+            stats.dump_stats(str(path))
+
+REPORT_DETAIL_FIELDS = ['file_size', 'sample_rate', 'channels', 'bits_per_sample', 'total_samples', 'block_count',
+                        'meta_bytes', 'picture_bytes', 'unknown_blocks', 'last_block_marked', 'audio_offset', 'stream_offset',
+                        'tail_tag_bytes', 'tail_junk_bytes', 'missing_samples', 'missing_seconds',
+                        'seek_points', 'seek_bad']
+TIMING_FIELDS = [f'{s}_ms' for s in STAGES]
+
+def report_record(res: Dict[str,Any]) -> Dict[str,Any]:
+    """报告行：原有列 + FlacProbe 摘要 + 各阶段耗时（毫秒）。缓存/续跑命中的结果没有后两部分。"""
+    rec = {k: res.get(k, '') for k in REPORT_FIELDS}
+    probe: Optional[FlacProbe] = res.get('_probe')
+    if probe is not None:
+        rec.update(file_size=probe.file_size, block_count=len(probe.blocks), meta_bytes=probe.total_meta_bytes_with_headers,
+                   picture_bytes=probe.picture_bytes_total, unknown_blocks=probe.unknown_block_count,
+                   last_block_marked=probe.last_block_marked, audio_offset=probe.audio_offset,
+                   stream_offset=probe.stream_offset)
+        si = probe.streaminfo
+        if si is not None:
+            rec.update(sample_rate=si.sample_rate, channels=si.channels, bits_per_sample=si.bits_per_sample,
+                       total_samples=si.total_samples)
+    tail: Optional[TailInfo] = res.get('_tail')
+    if tail is not None:
+        rec.update(tail_tag_bytes=tail.tag_bytes, tail_junk_bytes=tail.junk_bytes, missing_samples=tail.missing_samples)
+        si = probe.streaminfo
+        if si.sample_rate:
+            rec.update(missing_seconds=round(tail.missing_samples / si.sample_rate, 3))
+    seek: Optional[SeekCheck] = res.get('_seek')
+    if seek is not None:
+        rec.update(seek_points=seek.points, seek_bad=seek.bad)
+    for stage, sec in res.get('_timings', {}).items():
+        rec[f'{stage}_ms'] = round(sec * 1000, 3)
+    return rec
+
+class ReportWriter:
+    """边运行边写报告（csv / jsonl）：带缓冲，定期 flush，运行中即可 tail。"""
+    FLUSH_SECONDS = 2.0
+
+    def __init__(self, path: Path, fmt: str = 'csv'):
+        self.path = path
+        self.fmt = fmt
+        self.fp = path.open('w', newline='', encoding='utf-8', buffering=1 << 16)
+        self.writer = None
+        if fmt == 'csv':
+            self.writer = csv.DictWriter(self.fp, fieldnames=REPORT_FIELDS + REPORT_DETAIL_FIELDS + TIMING_FIELDS,
+                                         extrasaction='ignore')
+            self.writer.writeheader()
+        self.last_flush = time.monotonic()
+
+    def write(self, res: Dict[str,Any]):
+        rec = report_record(res)
+        if self.writer is not None:
+            self.writer.writerow(rec)
+        else:
+            self.fp.write(json.dumps(rec, ensure_ascii=False) + '\n')
+        if time.monotonic() - self.last_flush >= self.FLUSH_SECONDS:
+            self.fp.flush()
+            self.last_flush = time.monotonic()
+
+    def close(self):
+        self.fp.close()
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩百分位（输入需已排序）。"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, -(-q * len(sorted_values) // 100) - 1))
+    return sorted_values[int(k)]
+
+def format_duration(sec: float) -> str:
+    sec = int(sec)
+    return f'{sec // 3600}:{sec // 60 % 60:02d}:{sec % 60:02d}'
+
+class Console:
+    """逐文件输出：默认每个文件三行；quiet 只打印有问题的文件；progress 在 stderr 单行刷新
+    速度/ETA/各状态计数（同时只打印问题文件）；log_file 带缓冲写入全部明细。"""
+    PROBLEMS = ('FIXED', 'DRYRUN', 'FAIL', 'ERROR')
+    REFRESH_SECONDS = 0.5
+
+    def __init__(self, quiet: bool = False, progress: bool = False, log_file: str = ''):
+        self.quiet = quiet or progress
+        self.progress = progress
+        self.log = open(log_file, 'w', encoding='utf-8', buffering=1 << 16) if log_file else None
+        self.counts: Dict[str, int] = {}
+        self.done = 0
+        self.bytes = 0
+        self.t0 = self.last_draw = time.monotonic()
+        self.width = 0
+
+    def add(self, res: Dict[str,Any], walk: Optional[Dict[str,Any]] = None):
+        self.done += 1
+        self.counts[res['status']] = self.counts.get(res['status'], 0) + 1
+        probe = res.get('_probe')
+        if probe is not None:
+            self.bytes += probe.file_size
+        if res.get('_resumed'):
+            return  # 续跑沿用的结果只计数，不再逐条输出
+        text = f"[{res['status']}] {res['file']}\n  -> {res['reasons'] or ''}\n  => {res['message']}"
+        if self.log is not None:
+            self.log.write(text + '\n')
+        if not self.quiet or res['status'] in self.PROBLEMS:
+            self._clear()
+            print(text)
+        if self.progress and time.monotonic() - self.last_draw >= self.REFRESH_SECONDS:
+            self.draw(walk)
+
+    def draw(self, walk: Optional[Dict[str,Any]] = None):
+        self.last_draw = now = time.monotonic()
+        elapsed = max(now - self.t0, 1e-6)
+        rate = self.done / elapsed
+        found = (walk or {}).get('submitted', self.done)
+        walking = not (walk or {}).get('walk_done', True)
+        eta = format_duration((found - self.done) / rate) if rate > 0 else '--'
+        counts = ' '.join(f'{k} {v}' for k, v in sorted(self.counts.items()))
+        line = (f"{self.done}/{found}{'+' if walking else ''} | {rate:.1f} 文件/s | "
+                f"{self.bytes / elapsed / (1 << 20):.1f} MB/s | ETA {eta}{'+' if walking else ''} | {counts}")
+        sys.stderr.write('\r' + line.ljust(self.width))
+        sys.stderr.flush()
+        self.width = len(line)
+
+    def _clear(self):
+        if self.progress and self.width:
+            sys.stderr.write('\r' + ' ' * self.width + '\r')
+            self.width = 0
+
+    def close(self, walk: Optional[Dict[str,Any]] = None):
+        if self.progress and self.done:
+            self.draw(walk)
+            sys.stderr.write('\n')
+        if self.log is not None:
+            self.log.close()
+
 # ---------------------------- 核心处理 ----------------------------
 
-def process_one(path: Path, args) -> Dict[str,Any]:
-    result = {'file':str(path),'status':'SKIP','reasons':'','action':'','message':''}
+class SlotPool:
+    """带权重的信号量：多线程/分段编码一次占用多个槽位，避免整机超额订阅。"""
+    def __init__(self, total: int):
+        self.total = self.free = max(1, total)
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def hold(self, n: int = 1) -> Iterator[int]:
+        n = min(max(1, n), self.total)  # 超过总量的请求按总量发放，返回实际槽位数
+        with self._cond:
+            while self.free < n:
+                self._cond.wait()
+            self.free -= n
+        try:
+            yield n
+        finally:
+            with self._cond:
+                self.free += n
+                self._cond.notify_all()
+
+def _slots(pool: Optional[SlotPool], n: int = 1):
+    return pool.hold(n) if pool is not None else nullcontext(max(1, n))
+
+@dataclass
+class RunContext:
+    """一次运行内各线程共享的资源。"""
+    cache: Optional['ProbeCache'] = None
+    decode_pool: Optional[ProcessPoolExecutor] = None  # 解码校验放到独立进程，绕开 GIL
+    tools: Optional[ToolRegistry] = None
+    verify: str = 'decode'  # 'decode' | 'md5' | 'crc'
+    level: str = 'full'     # 'header' | 'sample' | 'full'
+    sample_windows: int = 8
+    sample_seed: str = field(default_factory=new_sample_seed)
+    # 各阶段独立限流：解析（I/O）、外部编码进程、全局 CPU 预算（解码与编码共用）
+    probe_slots: Optional[SlotPool] = None
+    repair_slots: Optional[SlotPool] = None
+    cpu_slots: Optional[SlotPool] = None
+    # 每个 st_dev 的读并发上限：机械盘 hdd_io，其余（SSD/网络盘/未知）ssd_io；0 表示不限
+    hdd_io: int = 0
+    ssd_io: int = 0
+    _devices: Dict[int, Optional[SlotPool]] = field(default_factory=dict, repr=False)
+    _dev_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def device_slots(self, path: Path):
+        try:
+            dev = os.stat(path).st_dev
+        except OSError:
+            return nullcontext(1)
+        with self._dev_lock:
+            if dev not in self._devices:
+                cap = self.hdd_io if is_rotational(dev) else self.ssd_io
+                self._devices[dev] = SlotPool(cap) if cap > 0 else None
+            return _slots(self._devices[dev])
+
+    def probe(self, path: Path, backend: str = 'pread') -> Tuple[FlacProbe, Optional[TailInfo], Optional[SeekCheck]]:
+        with _slots(self.probe_slots), self.device_slots(path):
+            return probe_file(path, backend)
+
+    @contextmanager
+    def encoder(self, n: int = 1) -> Iterator[int]:
+        """占用 n 个修复槽位及同样多的 CPU 槽位，返回实际获得的并行度。
+        固定先修复槽后 CPU 槽的顺序；解码只占 CPU 槽，不会反向等待，因此不会死锁。"""
+        with _slots(self.repair_slots, n) as n:
+            with _slots(self.cpu_slots, n) as n:
+                yield n
+
+    def _submit(self, fn, path: Path, *a, **kw):
+        # 加锁顺序固定为 设备槽 -> CPU 槽，与 probe()/encoder() 不构成环
+        with self.device_slots(path), _slots(self.cpu_slots):
+            if self.decode_pool is None:
+                return fn(path, *a, **kw)
+            return self.decode_pool.submit(fn, path, *a, **kw).result()
+
+    def check_frames(self, path: Path) -> Tuple[bool,str]:
+        return self._submit(frame_crc_ok, path)
+
+    def check(self, path: Path, streaminfo: Optional[StreamInfo] = None) -> Tuple[bool,str]:
+        """按扫描级别做首轮检查；修复后的验证始终走 decode() 完整校验。"""
+        if self.level == 'header':
+            return True, '未解码（header 级别）'
+        if self.level == 'sample':
+            return self._submit(soundfile_sample_ok, path, self.sample_windows, seed=self.sample_seed)
+        return self.decode(path, streaminfo)
+
+    def decode(self, path: Path, streaminfo: Optional[StreamInfo] = None) -> Tuple[bool,str]:
+        if self.verify == 'crc':
+            return self.check_frames(path)
+        kw: Dict[str,Any] = {}
+        if self.verify == 'md5':
+            # 未给出 STREAMINFO（如修复后的新文件）时现场解析，始终对照文件自身记录的 MD5
+            si = streaminfo if streaminfo is not None else parse_flac(path).streaminfo
+            if si is not None:
+                kw = {'expect_md5': si.md5, 'bits_per_sample': si.bits_per_sample}
+        # 只回传 (bool, str) 小结论，进程间开销可忽略
+        return self._submit(soundfile_decode_ok, path, **kw)
+
+def make_decode_pool(workers: int) -> Optional[ProcessPoolExecutor]:
+    if workers <= 0:
+        return None
+    import multiprocessing
+    # 统一用 spawn：主进程此时已有遍历/工作线程，fork 可能继承被占用的锁
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+REPORT_FIELDS = ['file','status','level','reasons','action','message']
+
+def new_result(path: Path, level: str = '', status: str = 'SKIP', message: str = '') -> Dict[str,Any]:
+    return {'file':str(path),'status':status,'level':level,'reasons':'','action':'','message':message}
+
+def process_one(path: Path, args, ctx: Optional[RunContext] = None) -> Dict[str,Any]:
+    if ctx is None:
+        ctx = RunContext()
+    cache = ctx.cache
+    if cache is None:
+        return _process_one(path, args, ctx)
     try:
-        probe = parse_flac(path)
+        st = path.stat()
+    except OSError as e:
+        return new_result(path, ctx.level, 'ERROR', f'{e.__class__.__name__}: {e}')
+    if not args.revalidate:
+        hit = cache.get(path, st)
+        if hit is not None:
+            return hit
+    result = _process_one(path, args, ctx)
+    try:
+        if result['status'] == 'FIXED':
+            # 修复后的文件已验证，按新的 inode/大小/mtime 记为 OK
+            clean = dict(new_result(path, result['level'], 'OK', '修复后验证通过'), reasons='（无）', action='skip')
+            cache.put(path, path.stat(), clean)
+        elif result['status'] in ProbeCache.CACHEABLE:
+            cache.put(path, st, result)
+    except (OSError, sqlite3.Error) as e:
+        cache.write_failed(e)  # 缓存写入失败不影响本次结论
+    return result
+
+def is_long(probe: FlacProbe, min_minutes: float) -> bool:
+    si = probe.streaminfo
+    return bool(si and si.sample_rate and si.total_samples >= min_minutes * 60 * si.sample_rate)
+
+def reencode_single(src: Path, dst: Path, action: str, probe: FlacProbe, tools: ToolRegistry) -> Tuple[bool,str]:
+    if action == 'ffmpeg':
+        return reencode_with_ffmpeg(src, dst, tools.path('ffmpeg'))
+    return reencode_with_flac_cli(src, dst, tools.path('flac'), probe.streaminfo)
+
+def _process_one(path: Path, args, ctx: RunContext) -> Dict[str,Any]:
+    result = new_result(path, ctx.level)
+    tools = ctx.tools or default_tools()
+    clock = StageClock()
+    result['_timings'] = clock.stages
+    result['_clock'] = clock
+    try:
+        probe, tail, seek = ctx.probe(path, args.parser)
+        result['_probe'] = probe
+        result['_tail'] = tail
+        result['_seek'] = seek
+        clock.lap('probe')
         if not probe.is_flac:
             result['status']='SKIP'; result['message']=probe.reason; return result
-        dec_ok, dec_msg = soundfile_decode_ok(path)
-        plan = decide_fix(probe, dec_ok, args.keep_cover, args.meta_threshold_mb, int(args.max_cover_mb*1024*1024))
+        dec_ok, dec_msg = ctx.check(path, probe.streaminfo)
+        result['_decode_ok'] = dec_ok
+        clock.lap('check')
+        md5_bad = dec_msg.startswith('MD5_MISMATCH')
+        frames_ok: Optional[bool] = None
+        if ctx.verify == 'crc' and ctx.level == 'full':
+            # crc 模式不解码，帧校验结论即音频结论
+            frames_ok, dec_ok = dec_ok, True
+        elif not dec_ok and not md5_bad and can_remux(probe):
+            # 解码失败时用帧 CRC 区分“仅头部损坏”与“音频本身损坏”
+            frames_ok, frames_msg = ctx.check_frames(path)
+            dec_msg += f'; {frames_msg}'
+            clock.lap('frames')
+        plan = decide_fix(probe, dec_ok, args.keep_cover, args.meta_threshold_mb, int(args.max_cover_mb*1024*1024),
+                          inplace=not args.no_inplace, md5_mismatch=md5_bad, frames_ok=frames_ok, tools=ctx.tools,
+                          tail=tail, fix_length=args.fix_length, seek=seek, rebuild_seektable=args.rebuild_seektable)
         result['reasons'] = '; '.join(plan.reasons) if plan.reasons else '（无）'
         result['action'] = plan.action
         if not plan.needs_fix:
             result['status']='OK'; result['message']=dec_msg; return result
+        if md5_bad:
+            result['status']='FAIL'; result['message']=f'{dec_msg}；无法无损修复，请从源文件恢复'; return result
+        if plan.action == 'skip' and tail is not None and tail.missing_samples:
+            result['status']='FAIL'; result['message']='流被截断；加 --fix-length 可按实际长度改写 STREAMINFO'; return result
         if args.dry_run:
-            result['status']='DRYRUN'; result['message']=f"将执行: {plan.action}"; return result
+            result['status']='DRYRUN'; result['message']=f"将执行: {plan.action}"
+            if frames_ok is False or not dec_ok:
+                result['message'] += f'（{dec_msg}）'
+            return result
 
         # 备份
         if args.backup:
             bak_dir = Path(args.backup_dir); bak_dir.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(path, bak_dir / path.name)
+            with ctx.device_slots(path):
+                shutil.copy2(path, bak_dir / path.name)
+            clock.lap('backup')
+
+        # 就地改写：只覆盖头部几 KB / 截掉尾部，无需临时文件。
+        # 以下各处读写整个文件或改写头尾时都占用设备槽；验证 ctx.decode() 自己会再取，不能嵌套在里面
+        cut_at = tail.cut_at if tail is not None and tail.cut_at < tail.size else 0
+        new_si = None
+        if plan.relength:
+            # 截到最后一个完整帧：不完整的末帧与其后的标签一并去掉
+            new_si = relength_streaminfo(probe.streaminfo, tail.end_sample)
+            cut_at = tail.audio_end if tail.audio_end < tail.size else 0
+        seektable: List[Tuple[int, bytes]] = []
+        if plan.seektable and plan.action in ('patch', 'remux'):
+            with ctx.device_slots(path):
+                table = rebuild_seektable(path, probe, args.seek_interval, cut_at)
+            seektable = [(3, table)] if table else []
+            clock.lap('frames')
+        # 重建失败时仍丢掉坏表（没有 SEEKTABLE 只是 seek 慢，错的表会让播放器跳错位置）
+        keep_seek = not (seektable or (plan.seektable and seek is not None and seek.bad))
+        if plan.action == 'patch' and plan.seektable and inplace_slack(
+                probe, plan.keep_cover, keep_seek, sum(4 + len(d) for _, d in seektable)) is None:
+            plan.action = result['action'] = 'remux'  # 新表放不进原头部区间
+        if plan.action in ('patch', 'truncate', 'relength'):
+            original = removed = None
+            si_offset = 0
+            with ctx.device_slots(path):
+                if plan.action == 'patch':
+                    original = patch_header_inplace(path, probe, plan.keep_cover, streaminfo=new_si, extra=seektable,
+                                                    keep_seektable=keep_seek)
+                    if original is None:
+                        result['status']='FAIL'; result['message']='patch 生成失败'; return result
+                elif plan.action == 'relength':
+                    si_offset = probe.blocks[0].offset + 4
+                    original = rewrite_streaminfo(path, probe, new_si)
+                if cut_at:
+                    removed = truncate_tail(path, cut_at)
+            clock.lap('repair')
+            dec2_ok, dec2_msg = ctx.decode(path)
+            clock.lap('verify')
+            if not dec2_ok:
+                with ctx.device_slots(path):
+                    if removed is not None:
+                        restore_tail(path, cut_at, removed)
+                    if original is not None:
+                        restore_header(path, original, si_offset)
+                result['status']='FAIL'; result['message']=f'就地修复后验证失败（已回滚）: {dec2_msg}'; return result
+            result['status']='FIXED'; result['message']=f'完成 {plan.action} 就地修复并验证成功'
+            return result
 
         # 同目录临时文件，避免跨盘
         with tempfile.TemporaryDirectory(dir=path.parent) as td:
             tmpdir = Path(td)
-            cover_tmp: Optional[Path] = None
-            if plan.keep_cover and which('metaflac'):
-                cover_tmp = export_cover_with_metaflac(path, tmpdir)
             out_tmp = tmpdir / (path.stem + '.__fixed__.flac')
 
             ok = False
-            if plan.action == 'ffmpeg':
-                ok = reencode_with_ffmpeg(path, out_tmp)
-            elif plan.action == 'flac':
-                ok = reencode_with_flac_cli(path, out_tmp)
+            tool_err = ''  # 重编码时外部工具 stderr 的最后一行，失败时附在说明后面
+            if plan.action == 'strip':
+                with ctx.device_slots(path):
+                    ok = strip_prefix(path, out_tmp, probe.stream_offset)
+            elif plan.action == 'remux':
+                with ctx.device_slots(path):
+                    ok = remux_flac(path, out_tmp, probe, plan.keep_cover, extra=seektable, audio_end=cut_at,
+                                    streaminfo=new_si, keep_seektable=keep_seek)
+            elif plan.action in ('ffmpeg','flac'):
+                want = args.encode_threads if is_long(probe, args.mt_min_minutes) else 1
+                with ctx.encoder(want) as threads:
+                    if threads > 1:
+                        # 超长文件：flac >= 1.5 直接多线程编码，否则分段并行编码后拼接
+                        if tools.has('flac', 'multithread') and tools.use != 'ffmpeg':
+                            plan.action = 'flac'
+                            ok, tool_err = reencode_with_flac_cli(path, out_tmp, tools.path('flac'), probe.streaminfo, threads)
+                        else:
+                            verified = ctx.level == 'full' and (frames_ok if frames_ok is not None else dec_ok)
+                            ok = reencode_parallel(path, out_tmp, probe.streaminfo, tools, threads, tmpdir, verified,
+                                                   args.seek_interval)
+                            if not ok:
+                                ok, tool_err = reencode_single(path, out_tmp, plan.action, probe, tools)
+                        result['action'] = plan.action
+                    else:
+                        ok, tool_err = reencode_single(path, out_tmp, plan.action, probe, tools)
             elif plan.action == 'metaflac':
-                ok = strip_all_metadata_with_metaflac(path)
+                with ctx.encoder():
+                    ok = strip_all_metadata_with_metaflac(path, tools.path('metaflac'))
+                clock.lap('repair')
                 if ok:
-                    dec2_ok, _ = soundfile_decode_ok(path)
+                    dec2_ok, _ = ctx.decode(path)
+                    clock.lap('verify')
                     result['status'] = 'FIXED' if dec2_ok else 'FAIL'
                     result['message'] = 'metaflac 清空元数据后验证' if dec2_ok else 'metaflac 清空后仍不可读'
                     return result
@@ -286,87 +2326,296 @@ def process_one(path: Path, args) -> Dict[str,Any]:
                 result['status']='FAIL'; result['message']='无可用修复工具（请安装 ffmpeg 或 flac）'; return result
 
             if not ok or not out_tmp.exists():
-                result['status']='FAIL'; result['message']=f'{plan.action} 生成失败'; return result
+                result['status']='FAIL'; result['message']=f'{plan.action} 生成失败'
+                if tool_err:
+                    result['message'] += f': {tool_err}'
+                return result
 
-            if plan.keep_cover and cover_tmp and which('metaflac'):
-                import_ok = import_cover_with_metaflac(out_tmp, cover_tmp)
-                if not import_ok:
-                    result['message'] += '（封面导入失败）'
+            if plan.action in ('ffmpeg','flac'):
+                # 重编码会丢封面：把原文件的 PICTURE 块原样接到新文件头部；
+                # 编码器自带的 SEEKTABLE 间隔不可控，需要时按 --seek-interval 重建
+                extra: List[Tuple[int, bytes]] = []
+                with ctx.device_slots(path):  # 临时文件与原文件同目录，同一设备
+                    fixed = parse_flac(out_tmp)
+                    if plan.seektable:
+                        table = rebuild_seektable(out_tmp, fixed, args.seek_interval)
+                        extra += [(3, table)] if table else []
+                    pictures = read_pictures(path, probe) if plan.keep_cover else []
+                    if extra or pictures:
+                        grafted = tmpdir / (path.stem + '.__graft__.flac')
+                        if remux_flac(out_tmp, grafted, fixed, False, extra=extra + pictures, keep_seektable=not extra):
+                            out_tmp = grafted
+                        else:
+                            result['message'] += '（封面保留失败）' if pictures else '（SEEKTABLE 重建失败）'
 
-            dec2_ok, dec2_msg = soundfile_decode_ok(out_tmp)
+            clock.lap('repair')
+            dec2_ok, dec2_msg = ctx.decode(out_tmp)
+            clock.lap('verify')
             if not dec2_ok:
-                result['status']='FAIL'; result['message']=f'修复后验证失败: {dec2_msg}'; return result
+                result['status']='FAIL'; result['message']=f'修复后验证失败: {dec2_msg}'
+                if tool_err:
+                    result['message'] += f'（{plan.action}: {tool_err}）'
+                return result
 
             atomic_replace(out_tmp, path)
+            clock.lap('replace')
             result['status']='FIXED'; result['message']=f'完成 {plan.action} 修复并验证成功'
             return result
 
     except Exception as e:
         result['status']='ERROR'; result['message']=f'{e.__class__.__name__}: {e}'
         return result
+    finally:
+        clock.stop()
 
 # ---------------------------- 扫描与主程序 ----------------------------
 
+def iter_flacs(root: Path, locality: bool = False) -> Iterator[Path]:
+    """按目录逐个产出；locality 为 True 时，机械盘上同目录的文件按物理偏移排序。"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        files = [Path(dirpath) / n for n in sorted(filenames) if n.lower().endswith('.flac')]
+        if locality and len(files) > 1:
+            files = order_by_extent(files)
+        yield from files
+
 def find_flacs(root: Path) -> List[Path]:
-    files: List[Path] = []
-    for dirpath, _, filenames in os.walk(root):
-        for n in filenames:
-            if n.lower().endswith('.flac'):
-                files.append(Path(dirpath) / n)
-    return files
+    return list(iter_flacs(root))
 
-def main():
+def run_pipeline(paths: Iterable[Path], fn: Callable[[Path], Dict[str,Any]], workers: int,
+                 max_inflight: int, stats: Optional[Dict[str,Any]] = None) -> Iterator[Dict[str,Any]]:
+    """边遍历边提交：遍历线程受 max_inflight 背压，主线程按完成顺序取结果。
+    在途任务（含已完成但主线程尚未取走的结果）不超过 max_inflight，内存占用与文件总数无关。stats 中实时更新 submitted / walk_done 供进度显示，
+    walk_seconds 为目录遍历累计耗时。"""
+    done_q: 'queue.Queue' = queue.Queue()
+    slots = threading.BoundedSemaphore(max_inflight)
+    submitted = [0]
+    END = object()
+    if stats is None:
+        stats = {}
+    stats.update(submitted=0, walk_done=False, walk_seconds=0.0)
+
+    def on_done(fut, path: Path):
+        done_q.put((path, fut))
+
+    def feeder(ex):
+        it = iter(paths)
+        try:
+            while True:
+                t = time.perf_counter()
+                p = next(it, None)
+                stats['walk_seconds'] += time.perf_counter() - t  # 只计遍历本身，不含背压等待
+                if p is None:
+                    break
+                slots.acquire()
+                fut = ex.submit(fn, p)
+                submitted[0] += 1
+                stats['submitted'] = submitted[0]
+                fut.add_done_callback(lambda f, p=p: on_done(f, p))
+        finally:
+            stats['walk_done'] = True
+            done_q.put(END)
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        walker = threading.Thread(target=feeder, args=(ex,), name='flac-walker', daemon=True)
+        walker.start()
+        received, walking = 0, True
+        while walking or received < submitted[0]:
+            item = done_q.get()
+            if item is END:
+                walking = False
+                continue
+            path, fut = item
+            received += 1
+            # 主线程取走结果才归还槽位：打印/写报告跟不上时已完成的结果也算在途，队列不会无限堆积
+            slots.release()
+            try:
+                yield fut.result()
+            except Exception as e:
+                yield new_result(path, status='ERROR', message=f'{e.__class__.__name__}: {e}')
+        walker.join()
+
+def sample_seed_arg(s: str) -> str:
+    if s != 'path':
+        try:
+            int(s)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f'应为整数或 path: {s!r}')
+    return s
+
+def build_parser() -> argparse.ArgumentParser:
     ap = argparse.ArgumentParser(description='递归扫描并修复异常 FLAC 文件')
     ap.add_argument('root', nargs='?', default='.', help='扫描根目录（默认：当前目录）')
-    ap.add_argument('--workers', type=int, default=max(4, os.cpu_count() or 4), help='并发线程数')
+    ap.add_argument('--probe-workers', '--workers', dest='probe_workers', type=int, default=max(4, os.cpu_count() or 4),
+                    help='同时解析头部的线程数（I/O 密集；--workers 为旧名）')
+    ap.add_argument('--decode-workers', type=int, default=os.cpu_count() or 4, help='解码校验进程数（0 表示在线程内解码）')
+    ap.add_argument('--repair-slots', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                    help='同时运行的外部编码进程数上限（分段/多线程编码按线程数占用多个槽位）')
+    ap.add_argument('--hdd-io', type=int, default=2, help='每块机械盘同时读取的文件数上限（0 表示不限）')
+    ap.add_argument('--ssd-io', type=int, default=0, help='每个 SSD/网络盘/未知设备同时读取的文件数上限（0 表示不限）')
+    ap.add_argument('--cpu-slots', type=int, default=os.cpu_count() or 4,
+                    help='解码与编码共用的 CPU 槽位总数，防止整机超额订阅（0 表示不限制）')
     ap.add_argument('--dry-run', action='store_true', help='只显示将要执行的操作，不实际修改')
     ap.add_argument('--backup', action='store_true', help='修复前备份原文件到指定目录')
     ap.add_argument('--backup-dir', type=str, default='./.flac_bak', help='备份目录（配合 --backup 使用）')
     ap.add_argument('--keep-cover', action='store_true', help='尽量保留封面（若太大则自动丢弃）')
     ap.add_argument('--max-cover-mb', type=float, default=1.5, help='保留封面的最大大小（MB）')
     ap.add_argument('--meta-threshold-mb', type=float, default=8.0, help='元数据大小阈值（超过则视为异常）')
-    ap.add_argument('--csv', type=str, default='', help='输出 CSV 报告路径')
+    ap.add_argument('--fix-length', action='store_true',
+                    help='流被截断（拷贝中断）时把 STREAMINFO 总样本数改写为实际长度，并截掉不完整的末帧；默认只报告')
+    ap.add_argument('--seek-interval', type=float, default=SEEK_INTERVAL_SECONDS,
+                    help=f'重建 SEEKTABLE 的点间隔（秒，默认 {SEEK_INTERVAL_SECONDS}）')
+    ap.add_argument('--rebuild-seektable', action='store_true',
+                    help='凡是 patch/remux/重编码都按 --seek-interval 重建 SEEKTABLE（默认只重建校验不通过的表）')
+    ap.add_argument('--no-inplace', action='store_true', help='禁用就地改写头部，始终写临时文件后替换')
+    ap.add_argument('--parser', choices=list(PARSER_BACKENDS), default='pread', help='元数据解析后端：pread 单次大块读 / mmap / stream 逐块 seek（默认 pread）')
+    ap.add_argument('--bench-parse', action='store_true', help='对扫描到的文件比较各解析后端的耗时与 I/O 调用数后退出')
+    ap.add_argument('--level', choices=['header','sample','full'], default='full',
+                    help='扫描级别：header 只解析头部 / sample 随机抽检若干段解码 / full 完整校验（默认）')
+    ap.add_argument('--sample-windows', type=int, default=8, help='sample 级别抽检的段数')
+    ap.add_argument('--sample-seed', type=sample_seed_arg, default=None,
+                    help='sample 级别抽检位置的种子：整数可复现某次运行，path 表示只按路径确定（每次都抽检同样的位置）；'
+                         '默认每次运行取新种子并记入报告')
+    ap.add_argument('--verify', choices=['decode','md5','crc'], default='decode',
+                    help='校验方式：decode 仅解码 / md5 解码并核对 STREAMINFO MD5 / crc 只校验帧头 CRC-8 与帧 CRC-16，不解码')
+    ap.add_argument('--cache', type=str, default='', help='增量缓存数据库路径（SQLite）；未变化的文件直接跳过')
+    ap.add_argument('--revalidate', action='store_true', help='忽略缓存命中，强制重新检查（结果仍写回缓存）')
+    ap.add_argument('--prune-cache', action='store_true', help='扫描前清理缓存中已删除或已变化文件的条目')
+    ap.add_argument('--journal', type=str, default='', help='运行日志路径（JSONL）；每个文件完成即记录，按批 fsync')
+    ap.add_argument('--resume', action='store_true', help='从 --journal 续跑：跳过上次已完成且未变化的文件')
+    ap.add_argument('--quiet', action='store_true', help='只打印有问题的文件（FIXED/DRYRUN/FAIL/ERROR）')
+    ap.add_argument('--progress', action='store_true', help='在 stderr 单行刷新进度（文件/s、MB/s、ETA、各状态计数），只打印有问题的文件')
+    ap.add_argument('--log-file', type=str, default='', help='把每个文件的完整明细写入日志文件（带缓冲）')
+    ap.add_argument('--timings', action='store_true', help='结束时打印各阶段耗时分布（p50/p95/p99）')
+    ap.add_argument('--profile', type=str, default='', help='用 cProfile 剖析整次运行（含工作线程），结果写入该文件（pstats 格式）')
+    ap.add_argument('--trace', type=str, default='', help='导出 Chrome trace JSON（chrome://tracing / Perfetto），查看各线程随时间的利用情况')
+    ap.add_argument('--csv', type=str, default='', help='输出 CSV 报告路径（运行中逐行写入）')
+    ap.add_argument('--jsonl', type=str, default='', help='输出 JSONL 报告路径（运行中逐行写入，含探测详情与各阶段耗时）')
+    ap.add_argument('--encode-threads', type=int, default=os.cpu_count() or 4, help='超长文件重编码时使用的线程/进程数')
+    ap.add_argument('--mt-min-minutes', type=float, default=20.0, help='时长超过此值（分钟）的文件启用多线程/分段并行编码')
     ap.add_argument('--use', choices=['ffmpeg','flac','auto'], default='auto', help='优先使用的修复方式（默认 auto）')
+    return ap
 
+def main():
+    ap = build_parser()
     args = ap.parse_args()
+    if args.resume and not args.journal:
+        ap.error('--resume 需要同时指定 --journal')
+    args.sample_seed = args.sample_seed or new_sample_seed()
 
-    if args.use in ('auto','ffmpeg') and not which('ffmpeg'):
-        print('[警告] 未检测到 ffmpeg，建议安装。', file=sys.stderr)
-    if args.use == 'flac' and not which('flac'):
+    tools = ToolRegistry.discover(args.use)
+    if args.use in ('auto','ffmpeg') and not tools.has('ffmpeg', 'flac_encoder'):
+        print('[警告] 未检测到可用的 ffmpeg（含 flac 编码器），建议安装。', file=sys.stderr)
+    if args.use == 'flac' and not tools.has('flac'):
         print('[警告] 未检测到 flac，将退化为其它方式。', file=sys.stderr)
-    if args.keep_cover and not which('metaflac'):
-        print('[提示] 要保留封面建议安装 metaflac，否则封面可能丢失。', file=sys.stderr)
 
     root = Path(args.root).resolve()
-    files = find_flacs(root)
-    if not files:
+
+    if args.bench_parse:
+        files = find_flacs(root)
+        if not files:
+            print('未找到 .flac 文件。'); return
+        for row in bench_parse(files):
+            print(f"{row['backend']:>6}: {row['ms_per_file']:.3f} ms/文件, {row['io_calls_per_file']:.1f} 次 I/O 调用/文件")
+        return
+
+    print(f'外部工具: {tools.describe()}')
+    ctx = RunContext(decode_pool=make_decode_pool(args.decode_workers), tools=tools, verify=args.verify,
+                     level=args.level, sample_windows=args.sample_windows, sample_seed=args.sample_seed,
+                     probe_slots=SlotPool(args.probe_workers), repair_slots=SlotPool(args.repair_slots),
+                     cpu_slots=SlotPool(args.cpu_slots) if args.cpu_slots > 0 else None,
+                     hdd_io=args.hdd_io, ssd_io=args.ssd_io)
+    # 线程只是各阶段的载体：等待解码/编码的线程不占 CPU，真正的并发上限由上面几个槽位池决定
+    threads = max(1, args.probe_workers) + max(0, args.decode_workers) + max(1, args.repair_slots)
+    print(f"并发: 解析 {args.probe_workers} / 解码 {args.decode_workers} / 修复 {args.repair_slots} / "
+          f"CPU {args.cpu_slots or '不限'}")
+    if args.level == 'sample':
+        print(f'抽检种子: {args.sample_seed}（用 --sample-seed {args.sample_seed} 可复现本次抽检位置）')
+    if args.cache:
+        ctx.cache = ProbeCache(Path(args.cache), cache_settings(args))
+        if args.prune_cache:
+            print(f'缓存清理: 删除 {ctx.cache.prune()} 条过期条目')
+
+    journal: Optional[RunJournal] = None
+    if args.journal:
+        journal = RunJournal(Path(args.journal), json.dumps([cache_settings(args), args.dry_run]), args.resume)
+        if journal.stale:
+            print('[警告] 运行日志的参数与本次不同，不续跑，从头开始记录。', file=sys.stderr)
+        elif args.resume:
+            print(f'续跑: 运行日志中有 {len(journal.done)} 个已完成文件')
+
+    def task(f: Path) -> Dict[str,Any]:
+        prev = journal.lookup(f) if journal is not None and args.resume else None
+        return prev if prev is not None else process_one(f, args, ctx)
+
+    profiler = ThreadProfiler() if args.profile else None
+    trace = TraceWriter(Path(args.trace)) if args.trace else None
+    stage_stats = StageStats()
+
+    print(f'开始扫描 {root} ...\n')
+
+    reports = [ReportWriter(Path(p), fmt) for p, fmt in ((args.csv, 'csv'), (args.jsonl, 'jsonl')) if p]
+    console = Console(args.quiet, args.progress, args.log_file)
+    walk: Dict[str,Any] = {}
+    total = ok = fixed = fail = resumed = 0
+    try:
+        for res in run_pipeline(iter_flacs(root, locality=True), profiler.wrap(task) if profiler else task,
+                                threads, threads * 2, walk):
+            t_out = time.perf_counter()
+            total += 1
+            if res['status'] in ('OK','DRYRUN'):
+                ok += 1
+            elif res['status'] == 'FIXED':
+                fixed += 1
+            elif res['status'] in ('FAIL','ERROR'):
+                fail += 1
+            for rw in reports:
+                rw.write(res)
+            console.add(res, walk)
+            if res.get('_resumed'):
+                resumed += 1
+            elif journal is not None:
+                journal.append(res)
+            stage_stats.add_timings(res.get('_timings', {}))
+            if trace is not None:
+                trace.add(res)
+                trace.span('output', t_out, time.perf_counter(), threading.current_thread(), {'file': res['file']})
+            stage_stats.add('output', time.perf_counter() - t_out)  # 主线程打印/写报告/写日志
+    finally:
+        console.close(walk)
+        if trace is not None:
+            trace.close()
+        if profiler is not None:
+            profiler.dump(Path(args.profile))
+        if journal is not None:
+            journal.close()
+        for rw in reports:
+            rw.close()
+        if ctx.cache is not None:
+            ctx.cache.close()
+        if ctx.decode_pool is not None:
+            ctx.decode_pool.shutdown()
+
+    if total == 0:
         print('未找到 .flac 文件。'); return
 
-    print(f'发现 {len(files)} 个 FLAC 文件，开始扫描...\n')
-
-    results: List[Dict[str,Any]] = []
-    with ThreadPoolExecutor(max_workers=args.workers) as ex:
-        futures = {ex.submit(process_one, f, args): f for f in files}
-        for fut in as_completed(futures):
-            f = futures[fut]
-            res = fut.result()
-            results.append(res)
-            print(f"[{res['status']}] {f}\n  -> {res['reasons'] or ''}\n  => {res['message']}")
-
-    total = len(results)
-    ok = sum(1 for r in results if r['status'] in ('OK','DRYRUN'))
-    fixed = sum(1 for r in results if r['status']=='FIXED')
-    fail = sum(1 for r in results if r['status'] in ('FAIL','ERROR'))
     print('\n=== Summary ===')
     print(f'Total: {total} | OK/DRY: {ok} | FIXED: {fixed} | FAIL/ERROR: {fail}')
+    if resumed:
+        print(f'其中 {resumed} 个沿用上次运行日志的结果')
+    if args.timings:
+        print(f"\n=== 各阶段耗时 ===\n目录遍历: {walk.get('walk_seconds', 0.0):.3f}s")
+        print(f"{'stage':<8} {'n':>8} {'total s':>10} {'mean ms':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+        for r in stage_stats.rows():
+            print(f"{r['stage']:<8} {r['n']:>8} {r['total_s']:>10.3f} {r['mean_ms']:>10.3f} "
+                  f"{r['p50_ms']:>10.3f} {r['p95_ms']:>10.3f} {r['p99_ms']:>10.3f}")
+    if args.profile:
+        print(f'cProfile 结果写入: {Path(args.profile).resolve()}（python -m pstats 查看）')
+    if args.trace:
+        print(f'Chrome trace 写入: {Path(args.trace).resolve()}')
 
-    if args.csv:
-        csv_path = Path(args.csv)
-        with csv_path.open('w', newline='', encoding='utf-8') as fp:
-            w = csv.DictWriter(fp, fieldnames=['file','status','reasons','action','message'])
-            w.writeheader()
-            w.writerows(results)
-        print(f'CSV 报告写入: {csv_path.resolve()}')
+    for rw in reports:
+        print(f'{rw.fmt.upper()} 报告写入: {rw.path.resolve()}')
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+flac_bench.py — flac_autofix 的基准测试：生成可复现的合成损坏 FLAC 语料，逐阶段计时。
+
+- 语料：按数量/时长/采样率/位深生成，损坏类型轮流取自 unknown / nolast / picture / trunc / id3 / clean。
+  相同参数（含 --seed）生成的语料逐字节一致，便于不同版本之间对比。
+- 计时：walk（目录遍历）以及 process_one 内各阶段 probe / check / frames / repair / verify / replace / total。
+- 输出 JSON（--json），可用 --compare 与旧结果逐阶段比较 p50。
+
+依赖：pip install numpy soundfile；修复阶段需要 ffmpeg 或 flac。
+"""
+
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Dict, Any
+
+import flac_autofix as fa
+
+KINDS = ['unknown', 'nolast', 'picture', 'trunc', 'id3', 'clean']
+
+# ---------------------------- 语料生成 ----------------------------
+
+def write_clean(path: Path, seconds: float, sample_rate: int, channels: int, bits: int, seed: int):
+    import numpy as np
+    import soundfile as sf
+    n = int(seconds * sample_rate)
+    rng = np.random.RandomState(seed)
+    t = np.arange(n) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * (220 + 20 * (seed % 16)) * t)
+    x = tone[:, None] * np.ones(channels) + 0.01 * rng.randn(n, channels)
+    sf.write(str(path), x, sample_rate, format='FLAC', subtype={16: 'PCM_16', 24: 'PCM_24'}[bits])
+
+def split_header(data: bytes) -> tuple:
+    """拆成 [(type, payload)] 与音频区；输入为 soundfile 刚写出的干净文件。"""
+    blocks, pos = [], 4
+    while True:
+        b0 = data[pos]
+        n = int.from_bytes(data[pos + 1:pos + 4], 'big')
+        blocks.append((b0 & 0x7F, data[pos + 4:pos + 4 + n]))
+        pos += 4 + n
+        if b0 & 0x80:
+            return blocks, data[pos:]
+
+def join_header(blocks: List[tuple], audio: bytes, mark_last: bool = True) -> bytes:
+    out = bytearray(b'fLaC')
+    for i, (t, payload) in enumerate(blocks):
+        last = mark_last and i == len(blocks) - 1
+        out += bytes([t | (0x80 if last else 0)]) + len(payload).to_bytes(3, 'big') + payload
+    return bytes(out + audio)
+
+def picture_payload(nbytes: int) -> bytes:
+    mime = b'image/jpeg'
+    return (struct.pack('>II', 3, len(mime)) + mime + struct.pack('>I', 0)
+            + struct.pack('>IIIII', 1000, 1000, 24, 0, nbytes) + b'\xff' * nbytes)
+
+def corrupt(data: bytes, kind: str, picture_mb: float = 4.0) -> bytes:
+    blocks, audio = split_header(data)
+    if kind == 'unknown':
+        return join_header(blocks[:1] + [(100, b'\x00' * 512)] + blocks[1:], audio)
+    if kind == 'nolast':
+        return join_header(blocks, audio, mark_last=False)
+    if kind == 'picture':
+        return join_header(blocks + [(6, picture_payload(int(picture_mb * 1024 * 1024)))], audio)
+    if kind == 'trunc':
+        return join_header(blocks, audio[:len(audio) * 2 // 3])
+    if kind == 'id3':
+        body = b'\x00' * 1024
+        size = bytes((len(body) >> s) & 0x7F for s in (21, 14, 7, 0))  # synchsafe
+        return b'ID3\x04\x00\x00' + size + body + data
+    return data
+
+def make_corpus(root: Path, count: int, seconds: float, sample_rate: int, channels: int, bits: int,
+                kinds: List[str], picture_mb: float, seed: int) -> List[Path]:
+    root.mkdir(parents=True, exist_ok=True)
+    files = []
+    for i in range(count):
+        kind = kinds[i % len(kinds)]
+        # 每 8 个文件一个子目录，让 walk 阶段有目录层次
+        d = root / f'album{i // 8:03d}'
+        d.mkdir(exist_ok=True)
+        path = d / f'{i:04d}_{kind}.flac'
+        write_clean(path, seconds, sample_rate, channels, bits, seed + i)
+        path.write_bytes(corrupt(path.read_bytes(), kind, picture_mb))
+        files.append(path)
+    return files
+
+# ---------------------------- 计时 ----------------------------
+
+def summarize(values_ms: List[float]) -> Dict[str, float]:
+    v = sorted(values_ms)
+    return {'n': len(v), 'total_ms': round(sum(v), 3), 'mean_ms': round(sum(v) / len(v), 3) if v else 0.0,
+            'p50_ms': round(fa.percentile(v, 50), 3), 'p95_ms': round(fa.percentile(v, 95), 3),
+            'p99_ms': round(fa.percentile(v, 99), 3)}
+
+def kind_of(path: str) -> str:
+    return Path(path).stem.split('_', 1)[-1]
+
+def run_bench(corpus: Path, work: Path, repeat: int, extra_args: List[str]) -> Dict[str, Any]:
+    stages: Dict[str, List[float]] = {'walk': []}
+    by_kind: Dict[str, Dict[str, Any]] = {}
+    tools = fa.ToolRegistry.discover('auto')
+    for _ in range(repeat):
+        # 修复会改写文件：每轮都从原始语料复制一份
+        if work.exists():
+            shutil.rmtree(work)
+        shutil.copytree(corpus, work)
+        args = fa.build_parser().parse_args([str(work), *extra_args])
+        ctx = fa.RunContext(tools=tools, verify=args.verify, level=args.level, sample_windows=args.sample_windows,
+                            sample_seed=args.sample_seed or fa.new_sample_seed())
+        t0 = time.perf_counter()
+        files = fa.find_flacs(work)
+        stages['walk'].append((time.perf_counter() - t0) * 1000)
+        for f in files:
+            res = fa.process_one(f, args, ctx)
+            for stage, sec in res.get('_timings', {}).items():
+                stages.setdefault(stage, []).append(sec * 1000)
+            k = by_kind.setdefault(kind_of(res['file']), {'status': {}, 'total': []})
+            k['status'][res['status']] = k['status'].get(res['status'], 0) + 1
+            k['total'].append(res.get('_timings', {}).get('total', 0.0) * 1000)
+    order = ['walk'] + [s for s in fa.STAGES if s in stages]
+    return {'stages': {s: summarize(stages[s]) for s in order},
+            'by_kind': {k: {'status': v['status'], **summarize(v['total'])} for k, v in sorted(by_kind.items())},
+            'tools': tools.describe()}
+
+def compare(old: Dict[str, Any], new: Dict[str, Any]) -> List[str]:
+    lines = [f"{'stage':<8} {'old p50':>10} {'new p50':>10} {'ratio':>7}"]
+    for stage, cur in new['stages'].items():
+        prev = old.get('stages', {}).get(stage)
+        if prev is None:
+            lines.append(f"{stage:<8} {'-':>10} {cur['p50_ms']:>10.3f} {'-':>7}")
+            continue
+        ratio = cur['p50_ms'] / prev['p50_ms'] if prev['p50_ms'] else float('inf')
+        lines.append(f"{stage:<8} {prev['p50_ms']:>10.3f} {cur['p50_ms']:>10.3f} {ratio:>6.2f}x")
+    return lines
+
+def main():
+    ap = argparse.ArgumentParser(description='flac_autofix 基准测试（合成损坏语料 + 分阶段计时）')
+    ap.add_argument('--dir', type=str, default='', help='语料目录（默认临时目录，结束后删除）；已存在则直接复用')
+    ap.add_argument('--count', type=int, default=24, help='文件数')
+    ap.add_argument('--seconds', type=float, default=30.0, help='每个文件时长（秒）')
+    ap.add_argument('--sample-rate', type=int, default=44100, help='采样率')
+    ap.add_argument('--channels', type=int, default=2, help='声道数')
+    ap.add_argument('--bits', type=int, choices=[16, 24], default=16, help='位深')
+    ap.add_argument('--kinds', type=str, default=','.join(KINDS), help=f'损坏类型，逗号分隔（{",".join(KINDS)}）')
+    ap.add_argument('--picture-mb', type=float, default=4.0, help='picture 类型注入的封面大小（MB）')
+    ap.add_argument('--seed', type=int, default=0, help='语料随机种子')
+    ap.add_argument('--repeat', type=int, default=1, help='重复轮数（每轮重新复制语料）')
+    ap.add_argument('--json', type=str, default='', help='结果 JSON 输出路径')
+    ap.add_argument('--compare', type=str, default='', help='与之前的结果 JSON 比较各阶段 p50')
+    ap.add_argument('autofix_args', nargs=argparse.REMAINDER, help='-- 之后的参数原样传给 flac_autofix（如 -- --verify crc）')
+    args = ap.parse_args()
+
+    kinds = [k.strip() for k in args.kinds.split(',') if k.strip()]
+    bad = [k for k in kinds if k not in KINDS]
+    if bad:
+        ap.error(f'未知损坏类型: {", ".join(bad)}')
+    extra = [a for a in args.autofix_args if a != '--']
+
+    tmp = None
+    base = Path(args.dir) if args.dir else Path(tmp := tempfile.mkdtemp(prefix='flac_bench_'))
+    corpus, work = base / 'corpus', base / 'work'
+    try:
+        if not corpus.exists():
+            t0 = time.perf_counter()
+            make_corpus(corpus, args.count, args.seconds, args.sample_rate, args.channels, args.bits,
+                        kinds, args.picture_mb, args.seed)
+            print(f'生成语料: {args.count} 个文件, {time.perf_counter() - t0:.1f}s -> {corpus}', file=sys.stderr)
+        result = run_bench(corpus, work, args.repeat, extra)
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    result['params'] = {k: getattr(args, k) for k in ('count', 'seconds', 'sample_rate', 'channels', 'bits',
+                                                      'picture_mb', 'seed', 'repeat')}
+    result['params'].update(kinds=kinds, autofix_args=extra)
+    result['env'] = {'python': platform.python_version(), 'platform': platform.platform(),
+                     'cpus': os.cpu_count(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+    for stage, st in result['stages'].items():
+        print(f"{stage:<8} n={st['n']:<5} p50 {st['p50_ms']:>9.3f} ms  p95 {st['p95_ms']:>9.3f} ms  "
+              f"total {st['total_ms']:>10.1f} ms")
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f'结果写入: {Path(args.json).resolve()}')
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        print('\n'.join(compare(old, result)))
+
+if __name__ == '__main__':
+    main()